@@ -3,6 +3,7 @@ from flask_login import LoginManager, login_required, current_user
 from config import Config
 from models import db, User, UserSettings
 from utils.translations import t
+import click
 import os
 
 login_manager = LoginManager()
@@ -80,10 +81,13 @@ def create_app():
         settings.vat_rate = data.get('vatRate', 18.0)
         settings.presumptive_tax_rate = data.get('presumptiveTaxRate', 3.0)
         settings.low_stock_alert_enabled = data.get('lowStockAlertEnabled', True)
-        settings.low_stock_threshold = data.get('lowStockThreshold', 10)
+        settings.low_stock_threshold = int(data.get('lowStockThreshold', 10))
         settings.sms_reminders_enabled = data.get('smsRemindersEnabled', False)
         settings.sms_phone_number = data.get('smsPhoneNumber')
 
+        from utils.low_stock import reflag_all
+        reflag_all(current_user.id, settings.low_stock_threshold)
+
         db.session.commit()
         return jsonify({'success': True})
 
@@ -100,6 +104,76 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(messages_bp)
 
+    # CLI commands
+    @app.cli.command('rebuild-rollups')
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user (default: everyone)')
+    def rebuild_rollups_command(user_id):
+        """Backfill the daily sales/expense rollup tables from raw rows."""
+        from utils.rollups import rebuild_rollups
+        rebuild_rollups(user_id)
+        click.echo('Rollups rebuilt.')
+
+    @app.cli.command('snapshot-stock')
+    @click.option('--user-id', type=int, default=None, help='Only snapshot this user (default: everyone)')
+    def snapshot_stock_command(user_id):
+        """Freeze current stock levels now; worker.py also does this daily."""
+        from utils.inventory import take_snapshots
+        taken_at = take_snapshots(user_id)
+        click.echo(f'Stock snapshot taken at {taken_at.isoformat()}.')
+
+    @app.cli.command('refresh-platform-metrics')
+    @click.option('--backfill-days', type=int, default=0, help='Also rebuild this many past days of history')
+    def refresh_platform_metrics_command(backfill_days):
+        """Recompute the admin dashboard's platform figures; run from cron every few minutes."""
+        from utils import platform_metrics
+        if backfill_days:
+            platform_metrics.backfill(backfill_days + 1)
+        platform_metrics.refresh_due()
+        click.echo('Platform metrics refreshed.')
+
+    @app.cli.command('send-sms')
+    @click.option('--once', is_flag=True, help='Send what is due and exit instead of polling')
+    @click.option('--interval', default=5, help='Seconds between polls when the queue is empty')
+    def send_sms_command(once, interval):
+        """Deliver queued SMS in multi-recipient batches, retrying failures with backoff."""
+        import time
+        from utils.sms import dispatch_pending
+        while True:
+            sent, failed = dispatch_pending()
+            if sent or failed:
+                click.echo(f'Sent {sent}, failed {failed}.')
+            if once:
+                break
+            if not (sent or failed):
+                time.sleep(interval)
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations to an existing database."""
+        from utils.migrations import upgrade
+        upgrade(echo=click.echo)
+        click.echo('Database is up to date.')
+
+    @app.cli.command('db-status')
+    def db_status_command():
+        """List schema migrations and whether they have been applied."""
+        from utils.migrations import MIGRATIONS, applied_versions
+        applied = applied_versions()
+        for version, description, _ in MIGRATIONS:
+            click.echo(f"{'applied' if version in applied else 'pending'}  {version:04d}  {description}")
+
+    @app.cli.command('explain-hot-queries')
+    @click.option('--user-id', type=int, default=1)
+    def explain_hot_queries_command(user_id):
+        """EXPLAIN the per-tenant hot queries and fail if any of them scans a table."""
+        from utils.query_plans import check_hot_queries
+        failures = 0
+        for label, uses_index, plan in check_hot_queries(user_id):
+            failures += not uses_index
+            click.echo(f"{'ok  ' if uses_index else 'SCAN'}  {label}: {plan}")
+        if failures:
+            raise SystemExit(1)
+
     with app.app_context():
         db.create_all()
 
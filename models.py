@@ -8,18 +8,21 @@ db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_status_created', 'subscription_status', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     first_name = db.Column(db.String(50))
     last_name = db.Column(db.String(50))
-    business_name = db.Column(db.String(100))
-    phone = db.Column(db.String(20))
+    business_name = db.Column(db.String(100), index=True)
+    phone = db.Column(db.String(20), index=True)
     language = db.Column(db.String(5), default='en')
     subscription_status = db.Column(db.String(20), default='trial')
     subscription_end = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -60,6 +63,15 @@ class UserSettings(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_user_barcode', 'user_id', 'barcode'),
+        db.Index('ix_products_user_stock', 'user_id', 'stock'),
+        db.Index('ix_products_user_low_stock', 'user_id', 'low_stock'),
+        db.Index('ix_products_user_name', 'user_id', 'name'),
+        db.Index('ix_products_user_model', 'user_id', 'model_number'),
+        db.Index('ix_products_user_created', 'user_id', 'created_at'),
+        db.Index('ft_products_search', 'name', 'model_number', 'category', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -70,13 +82,19 @@ class Product(db.Model):
     selling_price = db.Column(db.Float, nullable=False)
     stock = db.Column(db.Integer, default=0)
     category = db.Column(db.String(50))
+    low_stock = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Deleted products stay in the table so sale lines, movements and rollups keep their product
+    deleted_at = db.Column(db.DateTime)
 
     user = db.relationship('User', backref='products')
 
 
 class Sale(db.Model):
     __tablename__ = 'sales'
+    __table_args__ = (
+        db.Index('ix_sales_user_created', 'user_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -106,6 +124,9 @@ class SaleItem(db.Model):
 
 class Expense(db.Model):
     __tablename__ = 'expenses'
+    __table_args__ = (
+        db.Index('ix_expenses_user_created', 'user_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -119,6 +140,13 @@ class Expense(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_user_created', 'user_id', 'created_at'),
+        db.Index('ix_payments_created', 'created_at'),
+        db.Index('ix_payments_status_created', 'status', 'created_at'),
+        db.Index('ix_payments_transaction_ref', 'transaction_ref'),
+        db.Index('ix_payments_payer_phone', 'payer_phone'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -134,6 +162,11 @@ class Payment(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_user_sender_read', 'user_id', 'sender', 'is_read'),
+        db.Index('ix_messages_user_created', 'user_id', 'created_at'),
+        db.Index('ix_messages_sender_created', 'sender', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
@@ -154,4 +187,226 @@ class ActivityLog(db.Model):
     action = db.Column(db.String(100), nullable=False)
     details = db.Column(db.String(500))
     admin_action = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DailySalesRollup(db.Model):
+    __tablename__ = 'daily_sales_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_daily_sales_user_day'),
+        db.Index('ix_daily_sales_rollups_day', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    sales_total = db.Column(db.Float, nullable=False, default=0)
+    cost_total = db.Column(db.Float, nullable=False, default=0)
+    profit_total = db.Column(db.Float, nullable=False, default=0)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyExpenseRollup(db.Model):
+    __tablename__ = 'daily_expense_rollups'
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', 'category', name='uq_daily_expense_user_day_category'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    response = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, autoincrement=False)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class CatalogChange(db.Model):
+    __tablename__ = 'catalog_changes'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='uq_catalog_change_user_product'),
+        db.Index('ix_catalog_changes_user_version', 'user_id', 'version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ReportCache(db.Model):
+    __tablename__ = 'report_cache'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'cache_key', name='uq_report_cache_user_key'),
+        db.Index('ix_report_cache_user_range', 'user_id', 'start_day', 'end_day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    cache_key = db.Column(db.String(100), nullable=False)
+    start_day = db.Column(db.Date, nullable=False)
+    end_day = db.Column(db.Date, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ProductDailyRollup(db.Model):
+    __tablename__ = 'product_daily_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', 'day', name='uq_product_daily_user_product_day'),
+        db.Index('ix_product_daily_user_day', 'user_id', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    profit = db.Column(db.Float, nullable=False, default=0)
+
+
+class StockMovement(db.Model):
+    __tablename__ = 'stock_movements'
+    __table_args__ = (
+        db.Index('ix_stock_movements_product_created', 'user_id', 'product_id', 'created_at'),
+        db.Index('ix_stock_movements_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # sale, restock, adjustment, return
+    quantity = db.Column(db.Integer, nullable=False)  # signed change in stock
+    sale_id = db.Column(db.Integer, nullable=True)
+    note = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class StockSnapshot(db.Model):
+    __tablename__ = 'stock_snapshots'
+    __table_args__ = (
+        db.Index('ix_stock_snapshots_user_taken', 'user_id', 'taken_at'),
+        db.Index('ix_stock_snapshots_product_taken', 'product_id', 'taken_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False, default=0)
+    taken_at = db.Column(db.DateTime, nullable=False)
+
+
+class BarcodeMetadata(db.Model):
+    """Shared (not per-shop) cache of upstream barcode lookups, including "not found" answers."""
+    __tablename__ = 'barcode_metadata'
+
+    barcode = db.Column(db.String(20), primary_key=True)
+    found = db.Column(db.Boolean, nullable=False, default=True)
+    name = db.Column(db.String(200))
+    category = db.Column(db.String(100))
+    brand = db.Column(db.String(100))
+    image_url = db.Column(db.String(500))
+    source = db.Column(db.String(20))  # openfoodfacts, upcitemdb, or None for not found
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class RateLimitBucket(db.Model):
+    """Token-bucket state shared by every worker (utils.rate_limit database store)."""
+    __tablename__ = 'rate_limit_buckets'
+
+    key = db.Column(db.String(150), primary_key=True)
+    # Double precision: a single-precision FLOAT only resolves unix time to ~2 minutes
+    tokens = db.Column(db.Double, nullable=False)
+    updated_at = db.Column(db.Double, nullable=False, index=True)  # unix time
+
+
+class SmsMessage(db.Model):
+    """Outbound SMS queue; utils.sms.dispatch_pending sends and retries these."""
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_next', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    phone = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(480), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(255))
+    provider_message_id = db.Column(db.String(100))
+    cost = db.Column(db.String(30))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+class Job(db.Model):
+    """Deferred function call run by worker.py (see utils.jobs)."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    args = db.Column(db.JSON)
+    kwargs = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # also the lease while running
+    locked_by = db.Column(db.String(100))
+    result = db.Column(db.JSON)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+
+class PlatformMetrics(db.Model):
+    """One row per local business day of platform-wide admin figures (utils.platform_metrics).
+
+    Status, pending and unread counts are point-in-time and only known for
+    days that were refreshed live; backfilled days leave them NULL.
+    """
+    __tablename__ = 'platform_metrics'
+
+    day = db.Column(db.Date, primary_key=True)
+    users_total = db.Column(db.Integer, nullable=False, default=0)
+    new_users = db.Column(db.Integer, nullable=False, default=0)
+    users_active = db.Column(db.Integer)
+    users_trial = db.Column(db.Integer)
+    pending_payments = db.Column(db.Integer)
+    unread_messages = db.Column(db.Integer)
+    verified_revenue = db.Column(db.Float, nullable=False, default=0)
+    sales_total = db.Column(db.Float, nullable=False, default=0)
+    profit_total = db.Column(db.Float, nullable=False, default=0)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
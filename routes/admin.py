@@ -1,16 +1,19 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, session
-from models import db, User, Payment, Sale, Message, ActivityLog
+from models import db, User, Payment, Message, ActivityLog
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from utils.sms import notify_user_sms
+from sqlalchemy import select
+from utils.sms import notify_user_sms, queue_sms_to_all_users
+from utils import platform_metrics
+from utils.csv_export import parse_export_window, stream_rows, csv_response
+from utils.pagination import keyset_page, page_args, with_next_cursor
+from utils.admin_queries import user_list, payment_list, message_list
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 
 def log_activity(action, details=None):
-    log = ActivityLog(action=action, details=details, admin_action=True)
-    db.session.add(log)
-    db.session.commit()
+    """Record an admin action in the caller's transaction; it is saved by the caller's commit"""
+    db.session.add(ActivityLog(action=action, details=details, admin_action=True))
 
 
 @admin_bp.route('/logout')
@@ -25,49 +28,54 @@ def dashboard():
     if not session.get('is_admin'):
         return redirect(url_for('auth.login'))
 
-    today = datetime.utcnow().date()
-
-    total_users = User.query.count()
-    active_subscriptions = User.query.filter_by(subscription_status='active').count()
-    trial_users = User.query.filter_by(subscription_status='trial').count()
-    expired_users = total_users - active_subscriptions - trial_users
-    pending_payments = Payment.query.filter_by(status='pending').count()
-
-    today_sales = db.session.query(func.sum(Sale.total_amount)).filter(
-        func.date(Sale.created_at) == today
-    ).scalar() or 0
-
-    today_profit = db.session.query(func.sum(Sale.profit)).filter(
-        func.date(Sale.created_at) == today
-    ).scalar() or 0
-
-    total_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status == 'verified'
-    ).scalar() or 0
-
+    # One precomputed row instead of counting every tenant's data on each load
+    metrics = platform_metrics.current()
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    unread_messages = Message.query.filter_by(sender='user', is_read=False).count()
 
     return render_template('admin/dashboard.html',
-                           total_users=total_users,
-                           active_subscriptions=active_subscriptions,
-                           trial_users=trial_users,
-                           expired_users=expired_users,
-                           pending_payments=pending_payments,
-                           today_sales=today_sales,
-                           today_profit=today_profit,
-                           total_revenue=total_revenue,
+                           total_users=metrics.users_total,
+                           active_subscriptions=metrics.users_active,
+                           trial_users=metrics.users_trial,
+                           expired_users=metrics.users_total - metrics.users_active - metrics.users_trial,
+                           pending_payments=metrics.pending_payments,
+                           today_sales=metrics.sales_total,
+                           today_profit=metrics.profit_total,
+                           total_revenue=metrics.verified_revenue,
                            recent_users=recent_users,
-                           unread_messages=unread_messages,
+                           unread_messages=metrics.unread_messages,
+                           metrics_refreshed_at=metrics.refreshed_at,
                            now=datetime.utcnow())
 
 
+@admin_bp.route('/api/metrics/history')
+def api_metrics_history():
+    """Daily platform figures for growth charts: ?days=30 (up to 366)"""
+    if not session.get('is_admin'):
+        return jsonify([])
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    return jsonify([{
+        'day': str(m.day),
+        'users_total': m.users_total,
+        'new_users': m.new_users,
+        'users_active': m.users_active,
+        'users_trial': m.users_trial,
+        'verified_revenue': m.verified_revenue,
+        'sales_total': m.sales_total,
+        'profit_total': m.profit_total,
+        'sale_count': m.sale_count
+    } for m in platform_metrics.history(days)])
+
+
 @admin_bp.route('/api/users')
 def api_users():
     if not session.get('is_admin'):
         return jsonify([])
-    users = User.query.order_by(User.created_at.desc()).all()
-    return jsonify([{
+    try:
+        query, key, descending = user_list(request.args)
+        page = keyset_page(query, User, *page_args(), key=key, descending=descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_next_cursor(jsonify([{
         'id': u.id,
         'email': u.email,
         'business_name': u.business_name,
@@ -75,7 +83,7 @@ def api_users():
         'subscription_status': u.subscription_status,
         'days_remaining': u.days_remaining(),
         'created_at': u.created_at.isoformat() if u.created_at else None
-    } for u in users])
+    } for u in page.items]), page)
 
 
 @admin_bp.route('/api/users/<int:id>/activate', methods=['POST'])
@@ -85,8 +93,9 @@ def activate_user(id):
     user = User.query.get_or_404(id)
     user.subscription_status = 'active'
     user.subscription_end = datetime.utcnow() + timedelta(days=30)
-    db.session.commit()
     log_activity('User Activated', f'Activated {user.email}')
+    platform_metrics.queue_refresh()
+    db.session.commit()
     return jsonify({'success': True})
 
 
@@ -96,8 +105,9 @@ def suspend_user(id):
         return jsonify({'error': 'Unauthorized'}), 401
     user = User.query.get_or_404(id)
     user.subscription_status = 'suspended'
-    db.session.commit()
     log_activity('User Suspended', f'Suspended {user.email}')
+    platform_metrics.queue_refresh()
+    db.session.commit()
     return jsonify({'success': True})
 
 
@@ -105,8 +115,12 @@ def suspend_user(id):
 def api_payments():
     if not session.get('is_admin'):
         return jsonify([])
-    payments = Payment.query.order_by(Payment.created_at.desc()).all()
-    return jsonify([{
+    try:
+        query, key, descending = payment_list(request.args)
+        page = keyset_page(query, Payment, *page_args(), key=key, descending=descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_next_cursor(jsonify([{
         'id': p.id,
         'user_email': p.user.email if p.user else 'Unknown',
         'user_business': p.user.business_name if p.user else 'Unknown',
@@ -115,7 +129,7 @@ def api_payments():
         'amount': p.amount,
         'status': p.status,
         'created_at': p.created_at.isoformat() if p.created_at else None
-    } for p in payments])
+    } for p in page.items]), page)
 
 
 @admin_bp.route('/api/payments/<int:id>/verify', methods=['POST'])
@@ -127,13 +141,14 @@ def verify_payment(id):
     payment.verified_at = datetime.utcnow()
     payment.user.subscription_status = 'active'
     payment.user.subscription_end = datetime.utcnow() + timedelta(days=30)
-    db.session.commit()
-    log_activity('Payment Verified', f'Verified {payment.transaction_ref}')
 
-    # Send SMS notification
+    # Queue SMS notification (sent by the SMS worker once committed)
     if payment.user and payment.user.phone:
         notify_user_sms(payment.user, "Payment Confirmed",
                         "Your payment has been verified. Subscription active for 30 days.")
+    log_activity('Payment Verified', f'Verified {payment.transaction_ref}')
+    platform_metrics.queue_refresh()
+    db.session.commit()
 
     return jsonify({'success': True})
 
@@ -144,8 +159,9 @@ def reject_payment(id):
         return jsonify({'error': 'Unauthorized'}), 401
     payment = Payment.query.get_or_404(id)
     payment.status = 'rejected'
-    db.session.commit()
     log_activity('Payment Rejected', f'Rejected {payment.transaction_ref}')
+    platform_metrics.queue_refresh()
+    db.session.commit()
     return jsonify({'success': True})
 
 
@@ -153,8 +169,12 @@ def reject_payment(id):
 def api_messages():
     if not session.get('is_admin'):
         return jsonify([])
-    messages = Message.query.filter_by(sender='user').order_by(Message.created_at.desc()).all()
-    return jsonify([{
+    try:
+        query, key, descending = message_list(request.args)
+        page = keyset_page(query, Message, *page_args(), key=key, descending=descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_next_cursor(jsonify([{
         'id': m.id,
         'user_id': m.user_id,
         'user_email': m.user.email if m.user else 'Unknown',
@@ -164,7 +184,7 @@ def api_messages():
         'content': m.content,
         'is_read': m.is_read,
         'created_at': m.created_at.isoformat() if m.created_at else None
-    } for m in messages])
+    } for m in page.items]), page)
 
 
 @admin_bp.route('/api/messages/<int:id>/read', methods=['POST'])
@@ -173,6 +193,7 @@ def mark_read(id):
         return jsonify({'error': 'Unauthorized'}), 401
     msg = Message.query.get_or_404(id)
     msg.is_read = True
+    platform_metrics.queue_refresh()
     db.session.commit()
     return jsonify({'success': True})
 
@@ -196,13 +217,12 @@ def send_message():
         content=data['content']
     )
     db.session.add(msg)
-    db.session.commit()
 
-    # Send SMS notification
+    # Queue SMS notification
     if user.phone:
         notify_user_sms(user, data.get('subject', 'New Message'), data['content'])
-
     log_activity('Message Sent', f'To: {user.email}')
+    db.session.commit()
     return jsonify({'success': True})
 
 
@@ -220,11 +240,11 @@ def reply_message():
         content=data['content']
     )
     db.session.add(msg)
-    db.session.commit()
 
-    # Send SMS notification
+    # Queue SMS notification
     if user and user.phone:
         notify_user_sms(user, data.get('subject', 'Reply from Support'), data['content'])
+    db.session.commit()
 
     return jsonify({'success': True})
 
@@ -243,16 +263,15 @@ def announcements():
             is_announcement=True
         )
         db.session.add(msg)
-        db.session.commit()
-        log_activity('Announcement Sent', data['subject'])
 
-        # Send SMS to all users with phones
+        # Queue SMS to all users with phones; the SMS worker sends them in batches
+        queued = 0
         if data.get('send_sms'):
-            users = User.query.filter(User.phone.isnot(None)).all()
-            for user in users:
-                notify_user_sms(user, data['subject'], data['content'])
+            queued = queue_sms_to_all_users(data['subject'], data['content'])
+        log_activity('Announcement Sent', data['subject'])
+        db.session.commit()
 
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'sms_queued': queued})
 
     msgs = Message.query.filter_by(is_announcement=True).order_by(Message.created_at.desc()).all()
     return jsonify([{
@@ -278,21 +297,54 @@ def api_activity():
 
 @admin_bp.route('/api/export/users')
 def export_users():
+    """Stream users as CSV; optional ?status=&from=&to= (joined date)"""
     if not session.get('is_admin'):
         return jsonify({'error': 'Unauthorized'}), 401
-    users = User.query.all()
-    csv = "Business,Email,Phone,Status,Days Remaining,Joined\n"
-    for u in users:
-        csv += f"{u.business_name or 'N/A'},{u.email},{u.phone or 'N/A'},{u.subscription_status},{u.days_remaining()},{u.created_at.strftime('%Y-%m-%d') if u.created_at else 'N/A'}\n"
-    return csv, 200, {'Content-Type': 'text/csv', 'Content-Disposition': 'attachment; filename=users.csv'}
+    try:
+        window = parse_export_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = select(User.business_name, User.email, User.phone, User.subscription_status,
+                   User.subscription_end, User.created_at).order_by(User.id)
+    if request.args.get('status'):
+        query = query.where(User.subscription_status == request.args['status'])
+    if window:
+        query = query.where(window.filter(User.created_at))
+
+    def rows():
+        now = datetime.utcnow()
+        for u in stream_rows(query):
+            days_remaining = max(0, (u.subscription_end - now).days) if u.subscription_end else 0
+            yield (u.business_name or 'N/A', u.email, u.phone or 'N/A', u.subscription_status, days_remaining,
+                   u.created_at.strftime('%Y-%m-%d') if u.created_at else 'N/A')
+
+    return csv_response('users.csv', ['Business', 'Email', 'Phone', 'Status', 'Days Remaining', 'Joined'], rows())
 
 
 @admin_bp.route('/api/export/payments')
 def export_payments():
+    """Stream payments with their user as CSV; optional ?status=&from=&to="""
     if not session.get('is_admin'):
         return jsonify({'error': 'Unauthorized'}), 401
-    payments = Payment.query.all()
-    csv = "Date,Business,Email,Reference,Phone,Amount,Status\n"
-    for p in payments:
-        csv += f"{p.created_at.strftime('%Y-%m-%d') if p.created_at else 'N/A'},{p.user.business_name if p.user else 'N/A'},{p.user.email if p.user else 'N/A'},{p.transaction_ref},{p.payer_phone or 'N/A'},{p.amount},{p.status}\n"
-    return csv, 200, {'Content-Type': 'text/csv', 'Content-Disposition': 'attachment; filename=payments.csv'}
\ No newline at end of file
+    try:
+        window = parse_export_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The user columns come from the join, not a lazy load per payment
+    query = select(Payment.created_at, User.business_name, User.email, Payment.transaction_ref,
+                   Payment.payer_phone, Payment.amount, Payment.status
+                   ).outerjoin(User, User.id == Payment.user_id).order_by(Payment.created_at, Payment.id)
+    if request.args.get('status'):
+        query = query.where(Payment.status == request.args['status'])
+    if window:
+        query = query.where(window.filter(Payment.created_at))
+
+    def rows():
+        for p in stream_rows(query):
+            yield (p.created_at.strftime('%Y-%m-%d') if p.created_at else 'N/A', p.business_name or 'N/A',
+                   p.email or 'N/A', p.transaction_ref, p.payer_phone or 'N/A', p.amount, p.status)
+
+    return csv_response('payments.csv', ['Date', 'Business', 'Email', 'Reference', 'Phone', 'Amount', 'Status'],
+                        rows())
@@ -1,33 +1,72 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_file, current_app
 from flask_login import login_required, current_user
-from models import db, Product, Sale, Expense, Payment, UserSettings
-from datetime import datetime, timedelta
-from sqlalchemy import func
-import requests
+from models import db, Product, Sale, Expense, Payment, UserSettings, StockMovement, Job
+from config import Config
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, timedelta, timezone
 import re
-from time import time
+import json
+import os
+import uuid
+from utils.sales import process_sale, process_sale_batch, SaleError
+from utils.inventory import record_movements, set_stock, adjust_stock, stock_at, valuation, StockAdjustmentError, \
+    StockConflictError
+from utils.catalog import serialize_product, mark_changed, changes_since, stock_levels, current_version
+from utils import timewindow, barcode_cache, rate_limit
+from utils.rate_limit import client_key, limited_response
+from utils.rollups import record_expense
+from utils.reports import range_report, parse_report_window, GRANULARITIES, MAX_RANGE_DAYS, top_sellers, margin_ranking, dead_stock
+from utils.metrics import dashboard_metrics
+from utils.low_stock import refresh_low_stock, reflag_all, starts_low
+from utils.search import search_products, products_by_barcode
+from utils.product_import import import_products
+from utils.bulk_products import bulk_update, BulkUpdateError
+from utils.barcode_providers import fetch_barcode, ProviderError
+from utils.csv_export import parse_export_window
+from utils.pagination import keyset_page, page_args, with_next_cursor
+from utils.tenant_export import ENTITIES, FORMATS, estimate_rows, export_chunks, export_filename, export_path, \
+    export_expired, write_export
 
 api_bp = Blueprint('api', __name__)
 
-# Rate limiting storage for barcode lookups
-barcode_rate_limits = {}
-
 
 # Products API
 @api_bp.route('/products', methods=['GET'])
 @login_required
 def get_products():
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'model_number': p.model_number,
-        'barcode': p.barcode,
-        'buying_price': p.buying_price,
-        'selling_price': p.selling_price,
-        'stock': p.stock,
-        'category': p.category
-    } for p in products])
+    products = Product.query.filter_by(user_id=current_user.id, deleted_at=None).all()
+    return jsonify([serialize_product(p) for p in products])
+
+
+@api_bp.route('/products/search')
+@login_required
+def search_products_api():
+    """Word-prefix search on name, model number and category: ?q=&limit=&cursor="""
+    try:
+        products, next_cursor = search_products(current_user.id, request.args.get('q', ''),
+                                                request.args.get('limit', 50, type=int),
+                                                request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'products': [serialize_product(p) for p in products], 'next_cursor': next_cursor})
+
+
+@api_bp.route('/products/barcode/<barcode>')
+@login_required
+def product_by_barcode(barcode):
+    """The shop's own products with this exact barcode, for scanning at checkout"""
+    products = products_by_barcode(current_user.id, barcode.strip())
+    if not products:
+        return jsonify({'error': 'No product with this barcode', 'barcode': barcode}), 404
+    return jsonify({'products': [serialize_product(p) for p in products]})
+
+
+@api_bp.route('/catalog/changes')
+@login_required
+def catalog_changes():
+    """Products changed or deleted since the client's catalog version"""
+    since = request.args.get('since', 0, type=int)
+    return jsonify(changes_since(current_user.id, since))
 
 
 @api_bp.route('/products', methods=['POST'])
@@ -44,32 +83,152 @@ def add_product():
         stock=int(data.get('stock', 0)),
         category=data.get('category', '')
     )
+    product.low_stock = starts_low(current_user.id, product.stock)
     db.session.add(product)
+    db.session.flush()
+    record_movements(current_user.id, {product.id: product.stock}, 'restock', note='Opening stock')
+    mark_changed(current_user.id, [product.id])
     db.session.commit()
     return jsonify({'success': True, 'id': product.id})
 
 
+@api_bp.route('/products/import', methods=['POST'])
+@login_required
+def import_products_csv():
+    """Bulk add/update products from an uploaded CSV; streams NDJSON progress lines"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Upload a CSV file in the "file" field'}), 400
+    if upload.filename.lower().endswith(('.xlsx', '.xls')):
+        return jsonify({'error': 'Excel files are not supported - save the sheet as CSV and upload that'}), 400
+
+    user_id = current_user.id
+
+    def generate():
+        for progress in import_products(user_id, upload.stream):
+            yield json.dumps(progress) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api_bp.route('/products/bulk-update', methods=['POST'])
+@login_required
+def bulk_update_products():
+    """Set fields or reprice many products at once, by ids or category"""
+    data = request.json or {}
+    try:
+        summary = bulk_update(current_user.id, data)
+    except BulkUpdateError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(dict(summary, success=True))
+
+
 @api_bp.route('/products/<int:id>', methods=['PUT'])
 @login_required
 def update_product(id):
-    product = Product.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    product = Product.query.filter_by(id=id, user_id=current_user.id, deleted_at=None).first_or_404()
     data = request.json
     product.name = data.get('name', product.name)
     product.model_number = data.get('model_number', product.model_number)
     product.barcode = data.get('barcode', product.barcode)
     product.buying_price = float(data.get('buying_price', product.buying_price))
     product.selling_price = float(data.get('selling_price', product.selling_price))
-    product.stock = int(data.get('stock', product.stock))
     product.category = data.get('category', product.category)
+    if 'stock' in data:
+        try:
+            expected = data.get('expected_stock')
+            set_stock(current_user.id, product, int(data['stock']),
+                      expected=int(expected) if expected not in (None, '') else None)
+        except (TypeError, ValueError):
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'stock must be a whole number'}), 400
+        except StockConflictError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e), 'stock': e.current}), 409
+    mark_changed(current_user.id, [product.id])
+    refresh_low_stock(current_user.id, [product.id])
     db.session.commit()
     return jsonify({'success': True})
 
 
+@api_bp.route('/products/<int:id>/stock', methods=['POST'])
+@login_required
+def move_stock(id):
+    """Restock, return or adjust a product; quantity is the signed change"""
+    Product.query.filter_by(id=id, user_id=current_user.id, deleted_at=None).first_or_404()
+    data = request.json
+    try:
+        adjust_stock(current_user.id, id, int(data['quantity']), data.get('kind', 'restock'), data.get('note'))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'quantity must be a whole number'}), 400
+    except StockAdjustmentError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    mark_changed(current_user.id, [id])
+    refresh_low_stock(current_user.id, [id])
+    stock = stock_levels(current_user.id, [id]).get(id)
+    db.session.commit()
+    return jsonify({'success': True, 'stock': stock})
+
+
+@api_bp.route('/products/<int:id>/movements')
+@login_required
+def product_movements(id):
+    movements = StockMovement.query.filter_by(user_id=current_user.id, product_id=id).order_by(
+        StockMovement.created_at.desc()).limit(100).all()
+    return jsonify([{
+        'id': m.id,
+        'kind': m.kind,
+        'quantity': m.quantity,
+        'sale_id': m.sale_id,
+        'note': m.note,
+        'created_at': m.created_at.isoformat()
+    } for m in movements])
+
+
+@api_bp.route('/inventory/stock-at')
+@login_required
+def inventory_stock_at():
+    """Stock and valuation at a past moment: ?at=YYYY-MM-DD (end of that day) or an ISO timestamp"""
+    at = request.args.get('at')
+    try:
+        if at and len(at) == 10:
+            when = timewindow.to_utc(date.fromisoformat(at) + timedelta(days=1))
+        elif at:
+            when = datetime.fromisoformat(at)
+            if when.tzinfo is not None:
+                when = when.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            when = datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'at must be a date or ISO timestamp'}), 400
+
+    levels = stock_at(current_user.id, when)
+    names = dict(db.session.query(Product.id, Product.name).filter_by(user_id=current_user.id).all())
+    return jsonify({
+        'at': when.isoformat(),
+        'valuation': float(valuation(levels)),
+        'products': [{'id': pid, 'name': names.get(pid), 'stock': stock, 'unit_cost': cost}
+                     for pid, (stock, cost) in levels.items()]
+    })
+
+
 @api_bp.route('/products/<int:id>', methods=['DELETE'])
 @login_required
 def delete_product(id):
-    product = Product.query.filter_by(id=id, user_id=current_user.id).first_or_404()
-    db.session.delete(product)
+    product = Product.query.filter_by(id=id, user_id=current_user.id, deleted_at=None).first_or_404()
+    # Soft delete: sale lines, movements and rollups still point at the row.
+    # Writing the remaining stock off keeps valuations and stock_at() right.
+    try:
+        set_stock(current_user.id, product, 0, note='Product deleted')
+    except StockConflictError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e), 'stock': e.current}), 409
+    product.low_stock = False
+    product.deleted_at = datetime.utcnow()
+    mark_changed(current_user.id, [id], deleted=True)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -78,74 +237,35 @@ def delete_product(id):
 @api_bp.route('/barcode/lookup/<barcode>')
 @login_required
 def barcode_lookup(barcode):
-    # Rate limiting: max 30 requests per minute per user
-    user_id = str(current_user.id)
-    now = time()
-
-    if user_id in barcode_rate_limits:
-        rate_data = barcode_rate_limits[user_id]
-        if now > rate_data['reset_time']:
-            rate_data = {'count': 0, 'reset_time': now + 60}
-        rate_data['count'] += 1
-        barcode_rate_limits[user_id] = rate_data
-    else:
-        barcode_rate_limits[user_id] = {'count': 1, 'reset_time': now + 60}
-
-    if barcode_rate_limits[user_id]['count'] > 30:
-        return jsonify({'error': 'Too many requests. Please wait a minute.'}), 429
-
     # Validate barcode format (digits only, 8-14 characters)
     if not re.match(r'^\d{8,14}$', barcode):
         return jsonify({'error': 'Invalid barcode format'}), 400
 
-    try:
-        # Try Open Food Facts first (free, no API key needed)
-        off_response = requests.get(
-            f'https://world.openfoodfacts.org/api/v0/product/{barcode}.json',
-            timeout=10
-        )
-        off_data = off_response.json()
-
-        if off_data.get('status') == 1 and off_data.get('product'):
-            product = off_data['product']
-            categories = product.get('categories_tags', [])
-            category = categories[0].replace('en:', '') if categories else 'general'
-            return jsonify({
-                'name': product.get('product_name') or product.get('product_name_en') or 'Unknown Product',
-                'category': category,
-                'brand': product.get('brands'),
-                'imageUrl': product.get('image_url')
-            })
-
-        # Try UPC Database as fallback
-        upc_response = requests.get(
-            f'https://api.upcitemdb.com/prod/trial/lookup?upc={barcode}',
-            timeout=10
-        )
-        upc_data = upc_response.json()
-
-        if upc_data.get('items') and len(upc_data['items']) > 0:
-            item = upc_data['items'][0]
-            images = item.get('images', [])
-            return jsonify({
-                'name': item.get('title') or 'Unknown Product',
-                'category': item.get('category') or 'general',
-                'brand': item.get('brand'),
-                'imageUrl': images[0] if images else None
-            })
-
-        # Product not found
+    entry = barcode_cache.get(barcode)
+    if entry is None:
+        # Max 30 upstream lookups per minute per user, shared by all workers; cache hits are free
+        allowed, retry_after = rate_limit.take('barcode', client_key(), capacity=30, per=60)
+        if not allowed:
+            return limited_response(retry_after)
+
+        try:
+            source, product = fetch_barcode(barcode)
+        except ProviderError as e:
+            print(f"Barcode lookup error: {e}")
+            return jsonify({'error': 'Barcode lookup is unavailable. Try again.'}), 503
+        except Exception as e:
+            print(f"Barcode lookup error: {e}")
+            return jsonify({'error': 'Failed to lookup barcode'}), 500
+        entry = barcode_cache.put(barcode, source, product)
+        db.session.commit()
+
+    if not entry['found']:
         return jsonify({
             'error': 'Product not found',
             'barcode': barcode,
             'message': 'Product not in database. Enter details manually.'
         }), 404
-
-    except requests.Timeout:
-        return jsonify({'error': 'Request timeout. Try again.'}), 504
-    except Exception as e:
-        print(f"Barcode lookup error: {e}")
-        return jsonify({'error': 'Failed to lookup barcode'}), 500
+    return jsonify(dict(entry['product'], source=entry['source']))
 
 
 # Sales API
@@ -153,57 +273,77 @@ def barcode_lookup(barcode):
 @login_required
 def create_sale():
     data = request.json
-    items = data['items']
+    try:
+        sale = process_sale(current_user.id, data.get('items') or [], data.get('payment_method', 'cash'))
+        stock = stock_levels(current_user.id, [line['product_id'] for line in sale.items])
+        version = current_version(current_user.id)
+        db.session.commit()
+    except SaleError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': e.message, 'product_id': e.product_id}), e.status_code
 
-    total_amount = sum(float(item['selling_price']) * int(item['quantity']) for item in items)
-    total_cost = sum(float(item['buying_price']) * int(item['quantity']) for item in items)
-    profit = total_amount - total_cost
+    return jsonify({'success': True, 'id': sale.id, 'total': sale.total_amount, 'profit': sale.profit,
+                    'stock': stock, 'catalog_version': version})
 
-    sale = Sale(
-        user_id=current_user.id,
-        total_amount=total_amount,
-        total_cost=total_cost,
-        profit=profit,
-        payment_method=data.get('payment_method', 'cash'),
-        items=items
-    )
-    db.session.add(sale)
 
-    for item in items:
-        product = Product.query.get(item['product_id'])
-        if product and product.user_id == current_user.id:
-            product.stock -= int(item['quantity'])
+@api_bp.route('/sales/batch', methods=['POST'])
+@login_required
+def create_sales_batch():
+    """Ingest sales queued offline by the POS; replays are matched on idempotency_key"""
+    entries = (request.json or {}).get('sales') or []
+    if not isinstance(entries, list):
+        return jsonify({'success': False, 'error': 'sales must be a list'}), 400
+    if len(entries) > Config.SALES_BATCH_LIMIT:
+        return jsonify({'success': False, 'error': f'At most {Config.SALES_BATCH_LIMIT} sales per batch'}), 413
 
-    db.session.commit()
-    return jsonify({'success': True, 'id': sale.id, 'total': total_amount, 'profit': profit})
+    try:
+        results = process_sale_batch(current_user.id, entries)
+        version = current_version(current_user.id)
+        db.session.commit()
+    except SaleError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': e.message, 'product_id': e.product_id}), e.status_code
+    except IntegrityError:
+        # Another request stored one of these keys first; a retry will replay it
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Batch conflicted with a concurrent upload, retry'}), 409
+
+    return jsonify({'success': True, 'results': results, 'catalog_version': version})
 
 
 @api_bp.route('/sales', methods=['GET'])
 @login_required
 def get_sales():
-    sales = Sale.query.filter_by(user_id=current_user.id).order_by(Sale.created_at.desc()).limit(50).all()
-    return jsonify([{
+    """Newest first, one page at a time: ?limit=&cursor= (next cursor in the X-Next-Cursor header)"""
+    try:
+        page = keyset_page(Sale.query.filter_by(user_id=current_user.id), Sale, *page_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_next_cursor(jsonify([{
         'id': s.id,
         'total_amount': s.total_amount,
         'profit': s.profit,
         'payment_method': s.payment_method,
         'items': s.items,
         'created_at': s.created_at.isoformat()
-    } for s in sales])
+    } for s in page.items]), page)
 
 
 # Expenses API
 @api_bp.route('/expenses', methods=['GET'])
 @login_required
 def get_expenses():
-    expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.created_at.desc()).all()
-    return jsonify([{
+    try:
+        page = keyset_page(Expense.query.filter_by(user_id=current_user.id), Expense, *page_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_next_cursor(jsonify([{
         'id': e.id,
         'description': e.description,
         'amount': e.amount,
         'category': e.category,
         'created_at': e.created_at.isoformat()
-    } for e in expenses])
+    } for e in page.items]), page)
 
 
 @api_bp.route('/expenses', methods=['POST'])
@@ -214,9 +354,11 @@ def add_expense():
         user_id=current_user.id,
         description=data['description'],
         amount=float(data['amount']),
-        category=data['category']
+        category=data['category'],
+        created_at=datetime.utcnow()
     )
     db.session.add(expense)
+    record_expense(expense)
     db.session.commit()
     return jsonify({'success': True, 'id': expense.id})
 
@@ -225,6 +367,7 @@ def add_expense():
 @login_required
 def delete_expense(id):
     expense = Expense.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    record_expense(expense, sign=-1)
     db.session.delete(expense)
     db.session.commit()
     return jsonify({'success': True})
@@ -269,6 +412,7 @@ def save_settings():
     settings.low_stock_threshold = int(data.get('lowStockThreshold', 10))
     settings.sms_reminders_enabled = data.get('smsRemindersEnabled', False)
     settings.sms_phone_number = data.get('smsPhoneNumber', '')
+    reflag_all(current_user.id, settings.low_stock_threshold)
 
     db.session.commit()
     return jsonify({'success': True})
@@ -278,40 +422,14 @@ def save_settings():
 @api_bp.route('/dashboard/summary')
 @login_required
 def dashboard_summary():
-    today = datetime.utcnow().date()
-    month_start = today.replace(day=1)
-
-    today_sales = db.session.query(func.sum(Sale.total_amount)).filter(
-        Sale.user_id == current_user.id,
-        func.date(Sale.created_at) == today
-    ).scalar() or 0
-
-    today_profit = db.session.query(func.sum(Sale.profit)).filter(
-        Sale.user_id == current_user.id,
-        func.date(Sale.created_at) == today
-    ).scalar() or 0
-
-    month_sales = db.session.query(func.sum(Sale.total_amount)).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= month_start
-    ).scalar() or 0
-
-    month_profit = db.session.query(func.sum(Sale.profit)).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= month_start
-    ).scalar() or 0
-
-    monthly_expenses = db.session.query(func.sum(Expense.amount)).filter(
-        Expense.user_id == current_user.id,
-        Expense.created_at >= month_start
-    ).scalar() or 0
-
+    metrics = dashboard_metrics(current_user.id)
     return jsonify({
-        'todaySales': float(today_sales),
-        'todayProfit': float(today_profit),
-        'monthSales': float(month_sales),
-        'monthProfit': float(month_profit),
-        'monthlyExpenses': float(monthly_expenses)
+        'todaySales': metrics['today_sales'],
+        'todayProfit': metrics['today_profit'],
+        'todayExpenses': metrics['today_expenses'],
+        'monthSales': metrics['month_sales'],
+        'monthProfit': metrics['month_profit'],
+        'monthlyExpenses': metrics['month_expenses']
     })
 
 
@@ -335,20 +453,103 @@ def submit_payment():
 @api_bp.route('/reports/weekly')
 @login_required
 def weekly_report():
-    today = datetime.utcnow().date()
-    week_ago = today - timedelta(days=7)
-
-    daily_data = db.session.query(
-        func.date(Sale.created_at).label('date'),
-        func.sum(Sale.total_amount).label('sales'),
-        func.sum(Sale.profit).label('profit')
-    ).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= week_ago
-    ).group_by(func.date(Sale.created_at)).all()
-
+    report = range_report(current_user.id, timewindow.last_n_days(7))
+    db.session.commit()
     return jsonify([{
-        'date': str(d.date),
-        'sales': float(d.sales or 0),
-        'profit': float(d.profit or 0)
-    } for d in daily_data])
\ No newline at end of file
+        'date': d['date'],
+        'sales': d['sales'],
+        'profit': d['profit']
+    } for d in report['series']])
+
+
+@api_bp.route('/reports/range')
+@login_required
+def custom_range_report():
+    """Sales and expenses for an arbitrary from/to range at day, week or month granularity"""
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': 'granularity must be day, week or month'}), 400
+
+    try:
+        window = parse_report_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    report = range_report(current_user.id, window, granularity)
+    db.session.commit()
+    return jsonify(report)
+
+
+@api_bp.route('/reports/top-products')
+@login_required
+def top_products_report():
+    days = min(request.args.get('days', 30, type=int), MAX_RANGE_DAYS)
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    return jsonify(top_sellers(current_user.id, timewindow.last_n_days(days), limit))
+
+
+@api_bp.route('/reports/margins')
+@login_required
+def margin_report():
+    days = min(request.args.get('days', 30, type=int), MAX_RANGE_DAYS)
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    return jsonify(margin_ranking(current_user.id, timewindow.last_n_days(days), limit))
+
+
+@api_bp.route('/reports/dead-stock')
+@login_required
+def dead_stock_report():
+    """Products with stock on hand and no sales in the last N days"""
+    days = min(request.args.get('days', 60, type=int), MAX_RANGE_DAYS)
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    return jsonify(dead_stock(current_user.id, days, limit))
+
+
+# Data export for the shop's accountant
+@api_bp.route('/export/<entity>')
+@login_required
+def export_data(entity):
+    """Stream sales lines, expenses or products as CSV/NDJSON: ?format=&from=&to=&background=1
+
+    Large exports (or background=1) are queued as a job instead; poll /api/exports/<job_id>.
+    """
+    fmt = request.args.get('format', 'csv')
+    if entity not in ENTITIES or fmt not in FORMATS:
+        return jsonify({'error': f'Export one of {", ".join(ENTITIES)} as {" or ".join(FORMATS)}'}), 400
+    try:
+        window = parse_export_window(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('background') or estimate_rows(current_user.id, entity, window) > Config.EXPORT_INLINE_MAX_ROWS:
+        queued = write_export.delay(current_user.id, entity, fmt,
+                                    start_day=str(window.start_day) if window else None,
+                                    end_day=str(window.end_day) if window else None,
+                                    token=uuid.uuid4().hex)
+        db.session.commit()
+        return jsonify({'job_id': queued.id, 'status': queued.status}), 202
+
+    filename = export_filename(entity, fmt, window)
+    return Response(stream_with_context(export_chunks(current_user.id, entity, fmt, window)),
+                    mimetype=FORMATS[fmt][0],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@api_bp.route('/exports/<int:job_id>')
+@login_required
+def export_download(job_id):
+    """Status of a background export, or the gzip file once it is done"""
+    queued = db.session.get(Job, job_id)
+    if not queued or queued.name != write_export.job_name or (queued.args or [None])[0] != current_user.id:
+        return jsonify({'error': 'Export not found'}), 404
+    if queued.status != 'done':
+        return jsonify({'job_id': queued.id, 'status': queued.status})
+    if export_expired(queued.finished_at):
+        return jsonify({'error': 'Export has expired - start a new one'}), 410
+    path = export_path(current_user.id, queued.kwargs['token'])
+    if not os.path.exists(path):
+        current_app.logger.error('Export %s finished but %s is missing; the web process and worker must share '
+                                 'EXPORT_DIR', queued.id, path)
+        return jsonify({'error': 'Export file is no longer available'}), 410
+    return send_file(path, mimetype='application/gzip', as_attachment=True,
+                     download_name=queued.result['filename'])
@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, current_user
 from models import db, User
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from utils.rate_limit import rate_limit
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -13,6 +14,8 @@ ADMIN_PASSWORD = "ADMIN2001"
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', capacity=10, per=300, key=lambda: request.remote_addr, methods=('POST',),
+            message='Too many login attempts. Please wait a few minutes.')
 def login():
     # Already logged in?
     if session.get('is_admin'):
@@ -1,9 +1,12 @@
 from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_required, current_user
-from models import db, Product, Sale, Expense, UserSettings, SaleItem
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from models import db, Product, Expense, UserSettings
 from config import Config
+from utils.catalog import current_version
+from utils import timewindow
+from utils.reports import range_report, top_sellers
+from utils.metrics import dashboard_metrics
+from utils.pagination import keyset_page, page_args
 
 main_bp = Blueprint('main', __name__)
 
@@ -18,54 +21,28 @@ def index():
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    today = datetime.utcnow().date()
-
-    today_sales = db.session.query(func.sum(Sale.total_amount)).filter(
-        Sale.user_id == current_user.id,
-        func.date(Sale.created_at) == today
-    ).scalar() or 0
-
-    today_profit = db.session.query(func.sum(Sale.profit)).filter(
-        Sale.user_id == current_user.id,
-        func.date(Sale.created_at) == today
-    ).scalar() or 0
-
-    month_start = today.replace(day=1)
-    monthly_expenses = db.session.query(func.sum(Expense.amount)).filter(
-        Expense.user_id == current_user.id,
-        Expense.created_at >= month_start
-    ).scalar() or 0
-
-    monthly_sales = db.session.query(func.sum(Sale.total_amount)).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= month_start
-    ).scalar() or 0
-
-    monthly_profit = db.session.query(func.sum(Sale.profit)).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= month_start
-    ).scalar() or 0
-
-    products_count = Product.query.filter_by(user_id=current_user.id).count()
-
     settings = UserSettings.query.filter_by(user_id=current_user.id).first()
-    low_stock_threshold = settings.low_stock_threshold if settings else 5
 
-    low_stock = Product.query.filter(
-        Product.user_id == current_user.id,
-        Product.stock <= low_stock_threshold
-    ).all()
+    metrics = dashboard_metrics(current_user.id)
+
+    # Flags are maintained on write, so this reads only the flagged rows
+    low_stock = Product.query.filter_by(
+        user_id=current_user.id,
+        low_stock=True,
+        deleted_at=None
+    ).all() if metrics['low_stock_count'] else []
 
     vat_rate = settings.vat_rate if settings else 18.0
+    monthly_sales = metrics['month_sales']
     estimated_vat = monthly_sales * (vat_rate / 100) if monthly_sales else 0
 
     return render_template('dashboard.html',
-                           today_sales=today_sales,
-                           today_profit=today_profit,
+                           today_sales=metrics['today_sales'],
+                           today_profit=metrics['today_profit'],
                            monthly_sales=monthly_sales,
-                           monthly_profit=monthly_profit,
-                           monthly_expenses=monthly_expenses,
-                           products_count=products_count,
+                           monthly_profit=metrics['month_profit'],
+                           monthly_expenses=metrics['month_expenses'],
+                           products_count=metrics['products_count'],
                            low_stock=low_stock,
                            estimated_vat=estimated_vat,
                            days_remaining=current_user.days_remaining(),
@@ -76,92 +53,50 @@ def dashboard():
 @main_bp.route('/pos')
 @login_required
 def pos():
-    products = Product.query.filter_by(user_id=current_user.id).filter(Product.stock > 0).all()
-    return render_template('pos.html', products=products)
+    # Read the version first so anything changed while rendering shows up in the next delta
+    catalog_version = current_version(current_user.id)
+    products = Product.query.filter_by(user_id=current_user.id, deleted_at=None).filter(Product.stock > 0).all()
+    return render_template('pos.html', products=products, catalog_version=catalog_version)
 
 
 @main_bp.route('/products')
 @login_required
 def products():
-    products = Product.query.filter_by(user_id=current_user.id).order_by(Product.created_at.desc()).all()
-    return render_template('products.html', products=products)
+    cursor, limit = page_args(default=100)
+    try:
+        page = keyset_page(Product.query.filter_by(user_id=current_user.id, deleted_at=None), Product, cursor, limit)
+    except ValueError:
+        return redirect(url_for('main.products'))
+    return render_template('products.html', products=page.items, cursor=cursor, next_cursor=page.next_cursor)
 
 
 @main_bp.route('/expenses')
 @login_required
 def expenses():
-    expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.created_at.desc()).all()
+    cursor, limit = page_args(default=100)
+    try:
+        page = keyset_page(Expense.query.filter_by(user_id=current_user.id), Expense, cursor, limit)
+    except ValueError:
+        return redirect(url_for('main.expenses'))
     categories = ['rent', 'transport', 'salaries', 'supplies', 'utilities', 'other']
-    return render_template('expenses.html', expenses=expenses, categories=categories)
+    return render_template('expenses.html', expenses=page.items, categories=categories,
+                           cursor=cursor, next_cursor=page.next_cursor)
 
 
 @main_bp.route('/reports')
 @login_required
 def reports():
-    today = datetime.utcnow().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
-
-    # Weekly data
-    weekly_sales = db.session.query(
-        func.date(Sale.created_at).label('date'),
-        func.sum(Sale.total_amount).label('sales'),
-        func.sum(Sale.profit).label('profit'),
-        func.count(Sale.id).label('count')
-    ).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= week_ago
-    ).group_by(func.date(Sale.created_at)).order_by(func.date(Sale.created_at)).all()
-
-    weekly_data = [{'date': str(s.date), 'sales': float(s.sales or 0),
-                    'profit': float(s.profit or 0), 'count': int(s.count or 0)}
-                   for s in weekly_sales]
-
-    # Monthly data
-    monthly_sales = db.session.query(
-        func.date(Sale.created_at).label('date'),
-        func.sum(Sale.total_amount).label('sales'),
-        func.sum(Sale.profit).label('profit'),
-        func.count(Sale.id).label('count')
-    ).filter(
-        Sale.user_id == current_user.id,
-        Sale.created_at >= month_ago
-    ).group_by(func.date(Sale.created_at)).order_by(func.date(Sale.created_at)).all()
-
-    monthly_data = [{'date': str(s.date), 'sales': float(s.sales or 0),
-                     'profit': float(s.profit or 0), 'count': int(s.count or 0)}
-                    for s in monthly_sales]
-
-    # Expense breakdown by category
-    expense_breakdown = db.session.query(
-        Expense.category,
-        func.sum(Expense.amount).label('amount')
-    ).filter(
-        Expense.user_id == current_user.id,
-        Expense.created_at >= month_ago
-    ).group_by(Expense.category).all()
-
-    expense_data = [{'category': e.category.title() if e.category else 'Other',
-                     'amount': float(e.amount or 0)}
-                    for e in expense_breakdown]
-
-    # Top selling products (using JSON items field since SaleItem might not exist yet)
-    top_products = []
-    try:
-        top_products_query = db.session.query(
-            Product.name,
-            func.sum(SaleItem.quantity).label('quantity')
-        ).join(SaleItem, SaleItem.product_id == Product.id
-        ).join(Sale, Sale.id == SaleItem.sale_id
-        ).filter(
-            Sale.user_id == current_user.id,
-            Sale.created_at >= month_ago
-        ).group_by(Product.id).order_by(func.sum(SaleItem.quantity).desc()).limit(5).all()
-
-        top_products = [{'name': p.name, 'quantity': int(p.quantity or 0)}
-                        for p in top_products_query]
-    except:
-        pass
+    week = timewindow.last_n_days(7)
+    month = timewindow.last_n_days(30)
+
+    # The week is a slice of the month, so one report serves both toggles
+    report = range_report(current_user.id, month)
+    monthly_data = report['series']
+    weekly_data = [d for d in monthly_data if d['date'] >= str(week.start_day)]
+    expense_data = report['expenses']
+    db.session.commit()
+
+    top_products = top_sellers(current_user.id, month, limit=5)
 
     return render_template('reports.html',
                            weekly_data=weekly_data,
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, jsonify, flash, redirect,
 from flask_login import login_required, current_user
 from models import db, Message
 from datetime import datetime
+from utils.pagination import keyset_page, page_args
 
 messages_bp = Blueprint('messages', __name__)
 
@@ -9,21 +10,27 @@ messages_bp = Blueprint('messages', __name__)
 @messages_bp.route('/notifications')
 @login_required
 def notifications():
-    """User sees admin messages and announcements"""
+    """User sees admin messages, system alerts and announcements"""
     # Get direct messages to this user
-    user_messages = Message.query.filter_by(
-        user_id=current_user.id,
-        sender='admin'
-    ).order_by(Message.created_at.desc()).all()
-
-    # Get announcements (for all users)
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(Message.query.filter(
+            Message.user_id == current_user.id,
+            Message.sender.in_(('admin', 'system'))
+        ), Message, cursor, limit)
+    except ValueError:
+        return redirect(url_for('messages.notifications'))
+
+    # Get announcements (for all users) - only the latest ones, on the first page
     announcements = Message.query.filter_by(
         is_announcement=True
-    ).order_by(Message.created_at.desc()).all()
+    ).order_by(Message.created_at.desc(), Message.id.desc()).limit(10).all() if not cursor else []
 
     return render_template('notifications.html',
-                           messages=user_messages,
-                           announcements=announcements)
+                           messages=page.items,
+                           announcements=announcements,
+                           cursor=cursor,
+                           next_cursor=page.next_cursor)
 
 
 @messages_bp.route('/notifications/<int:id>/read', methods=['POST'])
@@ -75,10 +82,10 @@ def support():
 @login_required
 def unread_count():
     """Get unread notification count for navbar badge"""
-    count = Message.query.filter_by(
-        user_id=current_user.id,
-        sender='admin',
-        is_read=False
+    count = Message.query.filter(
+        Message.user_id == current_user.id,
+        Message.sender.in_(('admin', 'system')),
+        Message.is_read.is_(False)
     ).count()
 
     # Also count unread announcements
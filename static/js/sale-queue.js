@@ -0,0 +1,142 @@
+// Takwimu+ offline sale queue
+// Shared by pos.html and the service worker (via importScripts)
+
+(function (scope) {
+  const DB_NAME = 'takwimu-pos';
+  const DB_VERSION = 1;
+  const QUEUE_STORE = 'sales';
+  const REJECTED_STORE = 'rejected';
+  const BATCH_URL = '/api/sales/batch';
+  const BATCH_SIZE = 50;
+
+  function openDb() {
+    return new Promise((resolve, reject) => {
+      const request = indexedDB.open(DB_NAME, DB_VERSION);
+      request.onupgradeneeded = () => {
+        const db = request.result;
+        if (!db.objectStoreNames.contains(QUEUE_STORE)) {
+          db.createObjectStore(QUEUE_STORE, { keyPath: 'idempotency_key' });
+        }
+        if (!db.objectStoreNames.contains(REJECTED_STORE)) {
+          db.createObjectStore(REJECTED_STORE, { keyPath: 'idempotency_key' });
+        }
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+
+  function withStore(storeName, mode, callback) {
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const tx = db.transaction(storeName, mode);
+      const result = callback(tx.objectStore(storeName));
+      tx.oncomplete = () => resolve(result && 'result' in result ? result.result : result);
+      tx.onerror = () => reject(tx.error);
+    }));
+  }
+
+  function newKey() {
+    if (scope.crypto && scope.crypto.randomUUID) {
+      return scope.crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+  }
+
+  // Persist a completed sale locally; resolves once it is safely on disk
+  function add(sale) {
+    const record = Object.assign({
+      idempotency_key: newKey(),
+      created_at: new Date().toISOString()
+    }, sale);
+    return withStore(QUEUE_STORE, 'readwrite', (store) => store.put(record)).then(() => record);
+  }
+
+  function all(storeName = QUEUE_STORE) {
+    return withStore(storeName, 'readonly', (store) => store.getAll());
+  }
+
+  function count() {
+    return withStore(QUEUE_STORE, 'readonly', (store) => store.count());
+  }
+
+  function settle(results, sent) {
+    const byKey = {};
+    sent.forEach((sale) => { byKey[sale.idempotency_key] = sale; });
+
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const tx = db.transaction([QUEUE_STORE, REJECTED_STORE], 'readwrite');
+      const queue = tx.objectStore(QUEUE_STORE);
+      const rejected = tx.objectStore(REJECTED_STORE);
+      results.forEach((result) => {
+        const sale = byKey[result.idempotency_key];
+        if (!sale) return;
+        queue.delete(sale.idempotency_key);
+        if (result.status === 'rejected') {
+          // Kept until the user retries or discards it from the POS
+          rejected.put(Object.assign({}, sale, { error: result.error, rejected_at: new Date().toISOString() }));
+        }
+      });
+      tx.oncomplete = () => resolve(results);
+      tx.onerror = () => reject(tx.error);
+    }));
+  }
+
+  function rejectedCount() {
+    return withStore(REJECTED_STORE, 'readonly', (store) => store.count());
+  }
+
+  // Move a rejected sale back into the upload queue under the same idempotency key
+  function retry(key) {
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const tx = db.transaction([QUEUE_STORE, REJECTED_STORE], 'readwrite');
+      const rejected = tx.objectStore(REJECTED_STORE);
+      const request = rejected.get(key);
+      request.onsuccess = () => {
+        const sale = request.result;
+        if (!sale) return;
+        delete sale.error;
+        delete sale.rejected_at;
+        tx.objectStore(QUEUE_STORE).put(sale);
+        rejected.delete(key);
+      };
+      tx.oncomplete = () => resolve();
+      tx.onerror = () => reject(tx.error);
+    }));
+  }
+
+  function discard(key) {
+    return withStore(REJECTED_STORE, 'readwrite', (store) => store.delete(key));
+  }
+
+  let flushing = null;
+
+  // Upload queued sales in batches. Rejects on network failure so Background Sync retries.
+  function flush() {
+    if (flushing) return flushing;
+
+    flushing = all().then(async (queued) => {
+      const summary = { created: 0, duplicate: 0, rejected: 0 };
+      for (let i = 0; i < queued.length; i += BATCH_SIZE) {
+        const batch = queued.slice(i, i + BATCH_SIZE);
+        const response = await fetch(BATCH_URL, {
+          method: 'POST',
+          credentials: 'same-origin',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ sales: batch })
+        });
+        if (!response.ok) {
+          throw new Error('Sale upload failed with status ' + response.status);
+        }
+        const data = await response.json();
+        await settle(data.results || [], batch);
+        (data.results || []).forEach((result) => { summary[result.status] = (summary[result.status] || 0) + 1; });
+      }
+      return summary;
+    }).finally(() => {
+      flushing = null;
+    });
+    return flushing;
+  }
+
+  scope.SaleQueue = { add, all, count, flush, rejectedCount, retry, discard, REJECTED_STORE };
+})(self);
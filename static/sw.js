@@ -1,10 +1,14 @@
-const CACHE_NAME = 'takwimu-cache-v1';
+importScripts('/static/js/sale-queue.js');
+
+const CACHE_NAME = 'takwimu-cache-v4';
 const OFFLINE_URL = '/offline.html';
+const SALES_SYNC_TAG = 'sync-sales';
 
 const STATIC_ASSETS = [
   '/',
   '/static/css/style.css',
   '/static/js/main.js',
+  '/static/js/sale-queue.js',
   '/manifest.json',
   'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
   'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/bootstrap-icons.css',
@@ -113,6 +117,36 @@ self.addEventListener('fetch', (event) => {
   );
 });
 
+// Background Sync - upload sales queued while offline
+function flushSales() {
+  return SaleQueue.flush().then((summary) => {
+    return self.clients.matchAll().then((clients) => {
+      clients.forEach((client) => client.postMessage({ type: 'sales-synced', summary: summary }));
+    });
+  });
+}
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === SALES_SYNC_TAG) {
+    event.waitUntil(flushSales());
+  }
+});
+
+// Periodic fallback for browsers that support it
+self.addEventListener('periodicsync', (event) => {
+  if (event.tag === SALES_SYNC_TAG) {
+    event.waitUntil(flushSales());
+  }
+});
+
+self.addEventListener('message', (event) => {
+  if (event.data && event.data.type === 'flush-sales') {
+    event.waitUntil(flushSales().catch((error) => {
+      console.log('[ServiceWorker] Sale sync deferred:', error.message);
+    }));
+  }
+});
+
 // Handle push notifications (optional, for future use)
 self.addEventListener('push', (event) => {
   const options = {
@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database before config is imported: a
+# temporary SQLite file, or TEST_DATABASE_URL (e.g. a scratch MySQL database,
+# which the concurrency tests are meant for). Every table in it is dropped.
+_sqlite_path = None
+if os.environ.get('TEST_DATABASE_URL'):
+    os.environ['DATABASE_URL'] = os.environ['TEST_DATABASE_URL']
+else:
+    _sqlite_path = tempfile.mktemp(prefix='takwimu-test-', suffix='.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + _sqlite_path
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    yield app
+    if _sqlite_path and os.path.exists(_sqlite_path):
+        os.remove(_sqlite_path)
+
+
+@pytest.fixture(autouse=True)
+def clean_db(app):
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+    yield
+    with app.app_context():
+        db.session.remove()
@@ -0,0 +1,91 @@
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import event
+
+from models import db
+
+
+@contextmanager
+def count_statements(app):
+    """Collect every SQL statement sent to the database inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def register(app, email, phone=''):
+    """Test client logged in as a new shop."""
+    client = app.test_client()
+    response = client.post('/register', data={
+        'email': email, 'password': 'secret', 'confirm_password': 'secret',
+        'business_name': 'Shop ' + email.split('@')[0], 'phone': phone
+    })
+    assert response.status_code in (200, 302)
+    return client
+
+
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['is_admin'] = True
+    return client
+
+
+def add_product(client, name, stock, selling_price=1000, buying_price=600, **fields):
+    response = client.post('/api/products', json=dict(
+        name=name, stock=stock, selling_price=selling_price, buying_price=buying_price, **fields))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['id']
+
+
+@contextmanager
+def stub_http_server(respond):
+    """Local stand-in for an upstream API; `respond(handler)` returns (status, body bytes).
+
+    Yields the server; its URL is server_url(server) and every request path
+    is appended to `server.paths`.
+    """
+    paths = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            paths.append(self.path)
+            status, body = respond(self)
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        do_GET = do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.paths = paths
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def server_url(server):
+    return 'http://127.0.0.1:%d' % server.server_port
@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+from utils.barcode_providers import Provider, CircuitBreaker, ProviderError, fetch_barcode, parse_open_food_facts
+from tests.helpers import stub_http_server, server_url
+
+FOUND = json.dumps({'status': 1, 'product': {'product_name': 'Azam Cola', 'categories_tags': ['en:drinks']}}).encode()
+
+
+def provider(server, name='stub', threshold=3):
+    stub = Provider(name, server_url(server) + '/product/{barcode}.json', parse_open_food_facts,
+                    timeout=(0.5, 0.3))
+    stub.breaker = CircuitBreaker(threshold, cooldown=60)
+    return stub
+
+
+def slow(handler):
+    time.sleep(1.5)
+    return 200, FOUND
+
+
+def test_slow_provider_times_out_as_a_failure():
+    with stub_http_server(slow) as server:
+        stub = provider(server)
+        with pytest.raises(ProviderError):
+            stub.lookup('6001234567890')
+    assert stub.breaker.failures == 1
+
+
+def test_fast_provider_answers_while_another_hangs():
+    with stub_http_server(slow) as slow_server, stub_http_server(lambda h: (200, FOUND)) as fast_server:
+        started = time.monotonic()
+        source, product = fetch_barcode('6001234567890', [provider(slow_server, 'slow'), provider(fast_server, 'fast')],
+                                        deadline=3)
+        assert time.monotonic() - started < 1
+    assert source == 'fast'
+    assert product['name'] == 'Azam Cola'
+
+
+def test_failing_provider_opens_its_breaker_and_is_skipped():
+    with stub_http_server(lambda h: (500, b'{}')) as server:
+        stub = provider(server, threshold=2)
+        for _ in range(2):
+            with pytest.raises(ProviderError):
+                fetch_barcode('6001234567890', [stub], deadline=2)
+        assert stub.breaker.state == 'open'
+
+        with pytest.raises(ProviderError, match='circuit open'):
+            fetch_barcode('6001234567890', [stub], deadline=2)
+        assert len(server.paths) == 2
+
+
+def test_unexpected_body_is_a_provider_failure():
+    with stub_http_server(lambda h: (200, b'["not", "an", "object"]')) as server:
+        stub = provider(server)
+        with pytest.raises(ProviderError):
+            stub.lookup('6001234567890')
+    assert stub.breaker.failures == 1
+
+
+def test_not_found_everywhere_is_a_definite_miss():
+    with stub_http_server(lambda h: (404, b'{}')) as first, \
+            stub_http_server(lambda h: (200, b'{"status": 0}')) as second:
+        assert fetch_barcode('6001234567890', [provider(first, 'a'), provider(second, 'b')], deadline=2) == (None, None)
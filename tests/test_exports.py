@@ -0,0 +1,53 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from config import Config
+from models import db, Job
+from utils.jobs import claim, run_job, schedule_periodic
+from utils.tenant_export import sweep_exports
+from tests.helpers import register, add_product
+
+
+def run_queued(app):
+    with app.app_context():
+        for job_id in claim(10, 'test'):
+            assert run_job(job_id)
+
+
+def test_expired_export_is_swept_and_gone(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'EXPORT_DIR', str(tmp_path))
+    client = register(app, 'export@example.com')
+    add_product(client, 'Chalk', stock=4)
+
+    job_id = client.get('/api/export/products?background=1').get_json()['job_id']
+    run_queued(app)
+    response = client.get(f'/api/exports/{job_id}')
+    assert response.status_code == 200 and response.mimetype == 'application/gzip'
+    [export_file] = [os.path.join(d, f) for d, _, files in os.walk(tmp_path) for f in files]
+
+    stale = time.time() - Config.EXPORT_TTL - 60
+    os.utime(export_file, (stale, stale))
+    with app.app_context():
+        assert sweep_exports() == {'removed': 1}
+        db.session.get(Job, job_id).finished_at = datetime.utcnow() - timedelta(seconds=Config.EXPORT_TTL + 60)
+        db.session.commit()
+
+    assert not os.path.exists(export_file)
+    assert client.get(f'/api/exports/{job_id}').status_code == 410
+
+
+def test_fresh_exports_survive_the_sweep(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'EXPORT_DIR', str(tmp_path))
+    (tmp_path / '7').mkdir()
+    (tmp_path / '7' / 'fresh.gz').write_bytes(b'x')
+    with app.app_context():
+        assert sweep_exports() == {'removed': 0}
+
+
+def test_periodic_jobs_are_queued_once_per_interval(app):
+    with app.app_context():
+        queued = schedule_periodic()
+        assert 'tenant_export.sweep_exports' in queued
+        assert schedule_periodic() == []
+        assert Job.query.filter_by(name='tenant_export.sweep_exports').count() == 1
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from models import db, Product, StockSnapshot
+from utils.inventory import stock_at
+from utils.jobs import claim, run_job, schedule_periodic
+from tests.helpers import register, add_product
+
+
+def test_worker_takes_the_daily_snapshot_that_bounds_stock_at(app):
+    client = register(app, 'snapshot@example.com')
+    product_id = add_product(client, 'Nails', stock=50)
+
+    with app.app_context():
+        assert 'inventory.take_snapshots' in schedule_periodic()
+        for job_id in claim(10, 'test'):
+            assert run_job(job_id)
+        user_id = db.session.get(Product, product_id).user_id
+        assert StockSnapshot.query.filter_by(product_id=product_id).one().stock == 50
+
+    client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': 8}]})
+
+    with app.app_context():
+        assert stock_at(user_id, datetime.utcnow())[product_id][0] == 42
+        # Already ran within the day: not queued again
+        assert 'inventory.take_snapshots' not in schedule_periodic()
@@ -0,0 +1,48 @@
+from models import db, Product, Message
+from utils.low_stock import _flag_low
+from tests.helpers import register, add_product
+
+
+def alerts(app):
+    with app.app_context():
+        return [m.content for m in Message.query.filter_by(sender='system', subject='Low stock alert')]
+
+
+def test_product_created_below_threshold_is_flagged_without_alert(app):
+    client = register(app, 'created-low@example.com')
+    product_id = add_product(client, 'Matches', stock=3)
+
+    with app.app_context():
+        assert db.session.get(Product, product_id).low_stock is True
+    assert alerts(app) == []
+
+
+def test_alert_once_per_crossing(app):
+    client = register(app, 'crossing@example.com')
+    product_id = add_product(client, 'Sugar', stock=12)
+
+    def sell(quantity):
+        response = client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': quantity}]})
+        assert response.status_code == 200
+
+    sell(1)
+    assert alerts(app) == []
+    sell(2)
+    sell(1)
+    assert alerts(app) == ['1 product(s) at or below 10 in stock: Sugar (9)']
+
+    client.post(f'/api/products/{product_id}/stock', json={'quantity': 10})
+    sell(8)
+    assert len(alerts(app)) == 2
+
+
+def test_only_the_writer_that_flips_the_flag_alerts(app):
+    """Two sales can both read low_stock=False; the conditional UPDATE lets only one of them alert."""
+    client = register(app, 'race@example.com')
+    product_id = add_product(client, 'Salt', stock=12)
+
+    with app.app_context():
+        user_id = db.session.get(Product, product_id).user_id
+        db.session.query(Product).filter_by(id=product_id).update({'stock': 4})
+        assert _flag_low(user_id, product_id, 10) is True
+        assert _flag_low(user_id, product_id, 10) is False
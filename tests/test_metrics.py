@@ -0,0 +1,31 @@
+from models import User
+from utils.metrics import dashboard_metrics
+from tests.helpers import register, add_product, count_statements
+
+
+def _user_id(app, email):
+    with app.app_context():
+        return User.query.filter_by(email=email).one().id
+
+
+def test_dashboard_metrics_uses_a_fixed_number_of_statements(app):
+    client = register(app, 'metrics@example.com')
+    user_id = _user_id(app, 'metrics@example.com')
+
+    with count_statements(app) as empty, app.app_context():
+        dashboard_metrics(user_id)
+
+    product_id = add_product(client, 'Rice', stock=100, selling_price=500, buying_price=300)
+    for _ in range(5):
+        client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': 2}]})
+    client.post('/api/expenses', json={'description': 'Rent', 'amount': 1000, 'category': 'rent'})
+
+    with count_statements(app) as busy, app.app_context():
+        metrics = dashboard_metrics(user_id)
+
+    assert len(empty) == len(busy) == 3
+    assert metrics['today_sales'] == 5000
+    assert metrics['today_profit'] == 2000
+    assert metrics['today_count'] == 5
+    assert metrics['month_expenses'] == 1000
+    assert metrics['products_count'] == 1
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from config import Config
+from models import db, Job
+from utils import platform_metrics
+from tests.helpers import register
+
+
+def age(seconds):
+    row = platform_metrics.current()
+    row.refreshed_at = datetime.utcnow() - timedelta(seconds=seconds)
+    db.session.commit()
+
+
+def test_stale_row_is_refreshed_in_the_background(app):
+    with app.app_context():
+        platform_metrics.current()
+        age(Config.PLATFORM_METRICS_MAX_AGE + 60)
+        register(app, 'late@example.com')
+
+        assert platform_metrics.current().users_total == 0
+        assert Job.query.filter_by(name=platform_metrics.refresh_due.job_name).count() == 1
+
+
+def test_row_left_stale_without_a_worker_is_recomputed_inline(app):
+    with app.app_context():
+        platform_metrics.current()
+        age(Config.PLATFORM_METRICS_MAX_STALE + 60)
+        register(app, 'late@example.com')
+
+        row = platform_metrics.current()
+        assert row.users_total == 1
+        assert row.refreshed_at > datetime.utcnow() - timedelta(seconds=60)
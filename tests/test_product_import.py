@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+
+from models import db, Product, StockMovement, Message
+from tests.helpers import register, add_product
+
+CSV = '''name,barcode,model,cost,price,qty
+Rice 1kg,6001000000001,,1500,2000,40
+Rice 5kg,6001000000002,,7000,9000,7
+Oil 1L,,OIL-1,3000,3600,12
+Oil 1L,,OIL-2,3000,3600,2
+Candles,,,200,300,30
+Candles,,,200,300,25
+Soap,,,500,700,5
+'''
+
+
+def upload(client, text):
+    response = client.post('/api/products/import', data={'file': (io.BytesIO(text.encode()), 'stock.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.data.decode().splitlines()][-1]
+
+
+@pytest.fixture(params=['returning', 'read-back'])
+def insert_path(request, app, monkeypatch):
+    """Run each test with INSERT ... RETURNING and with the MySQL read-back path."""
+    if request.param == 'read-back':
+        with app.app_context():
+            monkeypatch.setattr(db.engine.dialect, 'insert_executemany_returning_sort_by_parameter_order', False)
+    return request.param
+
+
+def test_imported_rows_get_their_own_ids_and_opening_stock(app, insert_path):
+    client = register(app, f'import-{insert_path}@example.com')
+    assert upload(client, CSV)['created'] == 6
+    # Same names again within the same second: all new rows, none mixed up with the first import
+    second = CSV.replace('6001', '6002').replace('OIL-', 'OIL-B')
+    assert upload(client, second)['created'] == 6
+
+    with app.app_context():
+        products = Product.query.all()
+        assert len(products) == 12
+        opening = dict(db.session.query(StockMovement.product_id, StockMovement.quantity).filter_by(kind='restock'))
+        assert opening == {p.id: p.stock for p in products}
+        assert sorted(p.stock for p in products if p.name == 'Candles') == [25, 25]
+        assert {p.model_number: p.stock for p in products if p.name == 'Oil 1L'} == \
+            {'OIL-1': 12, 'OIL-2': 2, 'OIL-B1': 12, 'OIL-B2': 2}
+
+
+def test_imported_stock_is_flagged_like_any_other_stock_change(app, insert_path):
+    client = register(app, f'import-low-{insert_path}@example.com')
+    product_id = add_product(client, 'Flour', stock=20, barcode='6003000000001')
+
+    summary = upload(client, 'name,barcode,cost,price,qty\n'
+                             'Flour,6003000000001,900,1200,4\n'
+                             'Yeast,6003000000002,300,500,2\n')
+
+    assert (summary['created'], summary['updated']) == (1, 1)
+    with app.app_context():
+        assert {p.name: p.low_stock for p in Product.query} == {'Flour': True, 'Yeast': True}
+        alerts = [m.content for m in Message.query.filter_by(sender='system')]
+        # The existing product crossed the threshold; the new one was simply created low
+        assert alerts == ['1 product(s) at or below 10 in stock: Flour (4)']
+        assert db.session.get(Product, product_id).stock == 4
@@ -0,0 +1,30 @@
+from models import db, Product, SaleItem, StockMovement
+from tests.helpers import register, add_product
+
+
+def test_deleting_a_sold_product_keeps_its_sales(app):
+    client = register(app, 'delete@example.com')
+    product_id = add_product(client, 'Kettle', stock=5)
+    version = client.get('/api/catalog/changes?since=0').get_json()['version']
+    sale = client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': 2}]}).get_json()
+
+    assert client.delete(f'/api/products/{product_id}').status_code == 200
+
+    with app.app_context():
+        assert SaleItem.query.filter_by(sale_id=sale['id'], product_id=product_id).count() == 1
+        product = db.session.get(Product, product_id)
+        assert product.deleted_at is not None and product.stock == 0
+        write_off = StockMovement.query.filter_by(product_id=product_id, note='Product deleted').one()
+        assert write_off.quantity == -3
+
+    changes = client.get(f'/api/catalog/changes?since={version}').get_json()
+    assert changes['deleted'] == [product_id] and changes['products'] == []
+    assert client.get('/api/products').get_json() == []
+    assert client.get('/api/catalog/changes?since=0').get_json()['products'] == []
+    assert client.get('/api/reports/top-products?days=1').get_json()[0]['id'] == product_id
+
+    assert client.delete(f'/api/products/{product_id}').status_code == 404
+    assert client.put(f'/api/products/{product_id}', json={'name': 'Back'}).status_code == 404
+    assert client.post(f'/api/products/{product_id}/stock', json={'quantity': 1}).status_code == 404
+    sold = client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': 1}]})
+    assert sold.status_code == 400 and sold.get_json()['error'] == 'Product not found'
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from models import db, Sale, ProductDailyRollup
+from utils import rollups
+from tests.helpers import register, add_product
+
+
+def product_rollups():
+    return {(r.user_id, r.product_id, r.day): (r.quantity, round(r.revenue, 2), round(r.profit, 2))
+            for r in ProductDailyRollup.query}
+
+
+def test_rebuild_in_pages_matches_the_rollups_kept_on_write(app, monkeypatch):
+    for shop in ('rollup-a', 'rollup-b'):
+        client = register(app, f'{shop}@example.com')
+        ids = [add_product(client, name, stock=500) for name in ('Tea', 'Milk', 'Bread')]
+        for n in range(12):
+            client.post('/api/sales', json={'items': [{'product_id': ids[n % 3], 'quantity': 1 + n % 4},
+                                                      {'product_id': ids[(n + 1) % 3], 'quantity': 2}]})
+
+    with app.app_context():
+        # Spread the sales over several days, then rebuild the rollups to match
+        for n, sale in enumerate(Sale.query.order_by(Sale.id)):
+            sale.created_at = datetime.utcnow() - timedelta(days=n % 5, hours=n)
+        db.session.commit()
+        folded = {}
+        for sale in Sale.query:
+            rollups.product_lines(sale.user_id, sale.created_at, sale.items, folded)
+        expected = {key: (r['quantity'], round(r['revenue'], 2), round(r['profit'], 2)) for key, r in folded.items()}
+        assert len({key[2] for key in expected}) >= 5
+
+        monkeypatch.setattr(rollups, 'REBUILD_PAGE_SIZE', 4)
+        rollups.rebuild_rollups()
+        assert product_rollups() == expected
+
+        user_id = next(iter(expected))[0]
+        rollups.rebuild_rollups(user_id)
+        assert product_rollups() == expected
@@ -0,0 +1,45 @@
+import threading
+
+from models import db, Product, SaleItem
+from tests.helpers import register, add_product
+
+
+def test_sale_beyond_stock_is_refused_and_leaves_stock(app):
+    client = register(app, 'oversell@example.com')
+    product_id = add_product(client, 'Soda', stock=2)
+
+    response = client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': 3}]})
+
+    assert response.status_code == 409
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock == 2
+        assert SaleItem.query.count() == 0
+
+
+def test_parallel_sales_on_one_sku_never_oversell(app):
+    """Run with TEST_DATABASE_URL on MySQL to exercise InnoDB row locks; SQLite serialises writers."""
+    stock, tills = 5, 12
+    owner = register(app, 'parallel@example.com')
+    product_id = add_product(owner, 'Bread', stock=stock)
+    session_cookie = owner.get_cookie('session').value
+
+    barrier = threading.Barrier(tills)
+    statuses = []
+
+    def sell():
+        client = app.test_client()
+        client.set_cookie('session', session_cookie)
+        barrier.wait()
+        response = client.post('/api/sales', json={'items': [{'product_id': product_id, 'quantity': 1}]})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=sell) for _ in range(tills)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] * stock + [409] * (tills - stock)
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock == 0
+        assert SaleItem.query.filter_by(product_id=product_id).count() == stock
@@ -0,0 +1,114 @@
+import json
+from contextlib import ExitStack
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import pytest
+
+from config import Config
+from models import db, SmsMessage
+from utils.sms import queue_sms, dispatch_pending
+from tests.helpers import stub_http_server, server_url, count_statements
+
+
+class Gateway:
+    """Africa's Talking stand-in: accepts every number except those in `reject`."""
+
+    def __init__(self, reject=(), status=201):
+        self.reject = set(reject)
+        self.status = status
+        self.requests = []
+
+    def __call__(self, handler):
+        form = parse_qs(handler.rfile.read(int(handler.headers['Content-Length'])).decode())
+        self.requests.append({key: values[0] for key, values in form.items()})
+        if self.status != 201:
+            return self.status, b'{}'
+        recipients = [{
+            'number': number,
+            'statusCode': 403 if number in self.reject else 101,
+            'status': 'InvalidPhoneNumber' if number in self.reject else 'Success',
+            'messageId': 'ATXid_' + number,
+            'cost': 'TZS 20.0000'
+        } for number in form['to'][0].split(',')]
+        return 201, json.dumps({'SMSMessageData': {'Recipients': recipients}}).encode()
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """Start a stand-in gateway with gateway(**Gateway options) and point the SMS settings at it."""
+    with ExitStack() as stack:
+        def start(**options):
+            stub = Gateway(**options)
+            server = stack.enter_context(stub_http_server(stub))
+            monkeypatch.setattr(Config, 'SMS_API_KEY', 'test-key')
+            monkeypatch.setattr(Config, 'SMS_API_URL', server_url(server) + '/version1/messaging')
+            return stub
+        yield start
+
+
+def queue(app, count, message='Stock is low', first=0):
+    with app.app_context():
+        for i in range(first, first + count):
+            queue_sms('+2557%08d' % i, message)
+        db.session.commit()
+
+
+def statuses(app):
+    with app.app_context():
+        return {row.phone: row for row in SmsMessage.query.all()}
+
+
+def test_messages_are_sent_in_multi_recipient_batches(app, gateway):
+    stub = gateway()
+    queue(app, 150)
+    queue(app, 3, message='Payment confirmed', first=500)
+
+    with app.app_context():
+        assert dispatch_pending() == (153, 0)
+
+    assert sorted(len(r['to'].split(',')) for r in stub.requests) == [3, 50, 100]
+    rows = statuses(app)
+    assert {row.status for row in rows.values()} == {'sent'}
+    assert rows['+255700000007'].provider_message_id == 'ATXid_+255700000007'
+
+
+def test_rejected_recipient_is_retried_then_failed(app, gateway, monkeypatch):
+    monkeypatch.setattr(Config, 'SMS_MAX_ATTEMPTS', 2)
+    gateway(reject={'+255700000001'})
+    queue(app, 3)
+
+    with app.app_context():
+        assert dispatch_pending() == (2, 1)
+    bad = statuses(app)['+255700000001']
+    assert bad.status == 'queued'
+    assert bad.last_error == 'InvalidPhoneNumber'
+    assert bad.next_attempt_at > datetime.utcnow()
+
+    with app.app_context():
+        SmsMessage.query.filter_by(id=bad.id).update({'next_attempt_at': datetime.utcnow()})
+        db.session.commit()
+        assert dispatch_pending() == (0, 1)
+    assert statuses(app)['+255700000001'].status == 'failed'
+
+
+def test_gateway_error_leaves_messages_queued(app, gateway):
+    gateway(status=500)
+    queue(app, 4)
+
+    with app.app_context():
+        assert dispatch_pending() == (0, 4)
+    rows = statuses(app)
+    assert {row.status for row in rows.values()} == {'queued'}
+    assert {row.attempts for row in rows.values()} == {1}
+
+
+def test_dispatch_statement_count_does_not_grow_with_rows(app, gateway):
+    gateway()
+    queue(app, 50)
+
+    with count_statements(app) as statements, app.app_context():
+        assert dispatch_pending() == (50, 0)
+
+    # claim SELECT, lease UPDATE, one bulk UPDATE for the sent rows
+    assert len(statements) == 3
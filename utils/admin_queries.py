@@ -0,0 +1,126 @@
+from sqlalchemy import select, or_
+from sqlalchemy.orm import joinedload
+from models import User, Payment, Message
+from utils.csv_export import parse_export_window
+
+# Server-side filtering for the admin console lists. Each builder turns the
+# query string into (query, sort key, descending) for keyset_page(); every
+# filter is a plain column predicate and every search a prefix LIKE, so both
+# can use the indexes declared on the models.
+
+USER_STATUSES = ('trial', 'active', 'suspended')
+PAYMENT_STATUSES = ('pending', 'verified', 'rejected')
+MESSAGE_STATUSES = ('read', 'unread')
+
+
+def _prefix(column, q):
+    escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(escaped + '%', escape='\\')
+
+
+def _search_term(args):
+    q = (args.get('q') or '').strip()
+    if len(q) > 100:
+        raise ValueError('q is limited to 100 characters')
+    return q
+
+
+def _flag(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+def _choice(args, name, choices):
+    value = args.get(name) or None
+    if value is not None and value not in choices:
+        raise ValueError(f'{name} must be one of: {", ".join(choices)}')
+    return value
+
+
+def _sort(args, sorts):
+    name = args.get('sort') or 'newest'
+    if name not in sorts:
+        raise ValueError(f'sort must be one of: {", ".join(sorts)}')
+    return sorts[name]
+
+
+def _user_search(q):
+    """Email, business name or phone starts with `q` - each is indexed."""
+    return or_(
+        _prefix(User.email, q),
+        _prefix(User.business_name, q),
+        _prefix(User.phone, q)
+    )
+
+
+def user_list(args):
+    """?status=&from=&to=&has_phone=&q=&sort=newest|oldest|email"""
+    query = User.query
+    status = _choice(args, 'status', USER_STATUSES)
+    if status:
+        query = query.filter(User.subscription_status == status)
+    window = parse_export_window(args)
+    if window:
+        query = query.filter(window.filter(User.created_at))
+    has_phone = _flag(args, 'has_phone')
+    if has_phone is True:
+        query = query.filter(User.phone.isnot(None), User.phone != '')
+    elif has_phone is False:
+        query = query.filter(or_(User.phone.is_(None), User.phone == ''))
+    q = _search_term(args)
+    if q:
+        query = query.filter(_user_search(q))
+    key, descending = _sort(args, {
+        'newest': (User.created_at, True),
+        'oldest': (User.created_at, False),
+        'email': (User.email, False)
+    })
+    return query, key, descending
+
+
+def payment_list(args):
+    """?status=&from=&to=&q=&sort=newest|oldest - the payer is loaded in the same query."""
+    query = Payment.query.options(joinedload(Payment.user))
+    status = _choice(args, 'status', PAYMENT_STATUSES)
+    if status:
+        query = query.filter(Payment.status == status)
+    window = parse_export_window(args)
+    if window:
+        query = query.filter(window.filter(Payment.created_at))
+    q = _search_term(args)
+    if q:
+        query = query.filter(or_(
+            _prefix(Payment.transaction_ref, q),
+            _prefix(Payment.payer_phone, q),
+            Payment.user_id.in_(select(User.id).where(_user_search(q)))
+        ))
+    key, descending = _sort(args, {
+        'newest': (Payment.created_at, True),
+        'oldest': (Payment.created_at, False)
+    })
+    return query, key, descending
+
+
+def message_list(args):
+    """Support messages from users: ?status=read|unread&from=&to=&q=&sort=newest|oldest"""
+    query = Message.query.options(joinedload(Message.user)).filter(Message.sender == 'user')
+    status = _choice(args, 'status', MESSAGE_STATUSES)
+    if status:
+        query = query.filter(Message.is_read == (status == 'read'))
+    window = parse_export_window(args)
+    if window:
+        query = query.filter(window.filter(Message.created_at))
+    q = _search_term(args)
+    if q:
+        query = query.filter(Message.user_id.in_(select(User.id).where(_user_search(q))))
+    key, descending = _sort(args, {
+        'newest': (Message.created_at, True),
+        'oldest': (Message.created_at, False)
+    })
+    return query, key, descending
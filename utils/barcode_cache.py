@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import monotonic
+from config import Config
+from models import BarcodeMetadata
+from utils.db import upsert
+
+# Barcode metadata is the same for every shop, so it is cached across tenants
+# in two tiers: a per-process LRU (sub-millisecond repeat scans) in front of
+# the barcode_metadata table (shared by all workers, survives restarts).
+# "Not found" is cached too, with a shorter TTL, so unknown local products do
+# not hit the upstream APIs on every scan.
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+memory = LRUCache(Config.BARCODE_CACHE_SIZE)
+
+
+def _entry(row):
+    product = None
+    if row.found:
+        product = {'name': row.name, 'category': row.category, 'brand': row.brand, 'imageUrl': row.image_url}
+    return {'found': row.found, 'source': row.source, 'product': product, 'expires_at': row.expires_at}
+
+
+def _remember(barcode, entry):
+    remaining = (entry['expires_at'] - datetime.utcnow()).total_seconds()
+    if remaining > 0:
+        memory.set(barcode, entry, min(Config.BARCODE_MEMORY_TTL, remaining))
+
+
+def get(barcode):
+    """Cached entry {found, source, product, expires_at}, or None when neither tier has a live one."""
+    entry = memory.get(barcode)
+    if entry is not None:
+        return entry
+    row = BarcodeMetadata.query.filter(
+        BarcodeMetadata.barcode == barcode,
+        BarcodeMetadata.expires_at > datetime.utcnow()
+    ).first()
+    if row is None:
+        return None
+    entry = _entry(row)
+    _remember(barcode, entry)
+    return entry
+
+
+def put(barcode, source, product):
+    """Store an upstream answer (product=None means not found) in both tiers; the caller commits."""
+    now = datetime.utcnow()
+    ttl_days = Config.BARCODE_FOUND_TTL_DAYS if product else Config.BARCODE_NOT_FOUND_TTL_DAYS
+    product = product or {}
+    row = {
+        'barcode': barcode,
+        'found': bool(source),
+        'name': (product.get('name') or '')[:200] or None,
+        'category': (product.get('category') or '')[:100] or None,
+        'brand': (product.get('brand') or '')[:100] or None,
+        'image_url': (product.get('imageUrl') or '')[:500] or None,
+        'source': source,
+        'fetched_at': now,
+        'expires_at': now + timedelta(days=ttl_days)
+    }
+    upsert(BarcodeMetadata, [row], keys=('barcode',),
+           replace=('found', 'name', 'category', 'brand', 'image_url', 'source', 'fetched_at', 'expires_at'))
+    entry = _entry(BarcodeMetadata(**row))
+    _remember(barcode, entry)
+    return entry
+
@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+# Upstream barcode databases, queried concurrently. Each provider keeps a
+# pooled keep-alive session (no new TLS handshake per scan) and a circuit
+# breaker, so one that keeps timing out is skipped until it has had time to
+# recover instead of costing every scan a full timeout.
+
+
+class ProviderError(Exception):
+    """An upstream failed to answer; unlike "not found" this must not be cached."""
+
+
+class CircuitBreaker:
+    """Open after `threshold` consecutive failures; let one trial call through after `cooldown` seconds."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = monotonic()
+
+
+class Provider:
+    """One upstream: `url` is a format string with {barcode}; `parse` maps a 200 JSON body to a product or None."""
+
+    def __init__(self, name, url, parse, timeout=None):
+        self.name = name
+        self.url = url
+        self.parse = parse
+        self.timeout = timeout or (Config.BARCODE_CONNECT_TIMEOUT, Config.BARCODE_READ_TIMEOUT)
+        self.breaker = CircuitBreaker(Config.BARCODE_BREAKER_THRESHOLD, Config.BARCODE_BREAKER_COOLDOWN)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.BARCODE_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def lookup(self, barcode):
+        """Product dict or None for a definite "not found"; raises ProviderError otherwise."""
+        try:
+            response = self.session.get(self.url.format(barcode=barcode), timeout=self.timeout)
+            if response.status_code == 404:
+                product = None
+            elif response.status_code != 200:
+                # e.g. UPCitemdb's 429 once the trial quota is used up
+                raise ProviderError(f'{self.name} answered {response.status_code}')
+            else:
+                product = self.parse(response.json())
+        # Also parse errors: a reshaped or non-object body must count against the breaker
+        except (requests.RequestException, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.breaker.failure()
+            raise ProviderError(f'{self.name}: {e}')
+        except ProviderError:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return product
+
+
+def parse_open_food_facts(data):
+    if data.get('status') != 1 or not data.get('product'):
+        return None
+    product = data['product']
+    categories = product.get('categories_tags', [])
+    return {
+        'name': product.get('product_name') or product.get('product_name_en') or 'Unknown Product',
+        'category': categories[0].replace('en:', '') if categories else 'general',
+        'brand': product.get('brands'),
+        'imageUrl': product.get('image_url')
+    }
+
+
+def parse_upc_item_db(data):
+    items = data.get('items') or []
+    if not items:
+        return None
+    item = items[0]
+    images = item.get('images', [])
+    return {
+        'name': item.get('title') or 'Unknown Product',
+        'category': item.get('category') or 'general',
+        'brand': item.get('brand'),
+        'imageUrl': images[0] if images else None
+    }
+
+
+PROVIDERS = []
+
+
+def register(provider):
+    """Add an upstream; every registered provider is asked in parallel."""
+    PROVIDERS.append(provider)
+    return provider
+
+
+# Open Food Facts is free and needs no API key
+register(Provider('openfoodfacts', 'https://world.openfoodfacts.org/api/v0/product/{barcode}.json',
+                  parse_open_food_facts))
+register(Provider('upcitemdb', 'https://api.upcitemdb.com/prod/trial/lookup?upc={barcode}', parse_upc_item_db))
+
+_executor = ThreadPoolExecutor(max_workers=Config.BARCODE_POOL_SIZE, thread_name_prefix='barcode')
+
+
+def fetch_barcode(barcode, providers=None, deadline=None):
+    """(source, product) from the first provider with a hit, or (None, None) when all say "not found".
+
+    Providers whose breaker is open are skipped. Raises ProviderError when no
+    provider found the barcode and any of them failed, was skipped or ran past
+    `deadline` seconds - that is not a definite "not found".
+    """
+    providers = PROVIDERS if providers is None else providers
+    deadline = deadline or Config.BARCODE_LOOKUP_DEADLINE
+    skipped = [p.name for p in providers if not p.breaker.allow()]
+    pending = {_executor.submit(p.lookup, barcode): p for p in providers if p.name not in skipped}
+    failures = [f'{name}: circuit open' for name in skipped]
+
+    give_up = monotonic() + deadline
+    while pending:
+        done, _ = wait(pending, timeout=max(0, give_up - monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            failures += [f'{p.name}: no answer within {deadline}s' for p in pending.values()]
+            break
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                product = future.result()
+            except ProviderError as e:
+                failures.append(str(e))
+                continue
+            if product:
+                return provider.name, product
+
+    if failures:
+        raise ProviderError('; '.join(failures))
+    return None, None
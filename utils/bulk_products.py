@@ -0,0 +1,104 @@
+from sqlalchemy import update, case, func
+from models import db, Product
+from utils.catalog import mark_changed
+
+SETTABLE = ('category', 'buying_price', 'selling_price')
+PRICE_FIELDS = ('buying_price', 'selling_price')
+MAX_IDS = 5000
+
+
+class BulkUpdateError(Exception):
+    pass
+
+
+def _number(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BulkUpdateError(f'{name} must be a number')
+
+
+def target_filter(user_id, data):
+    """WHERE clause for the products a bulk request targets: explicit ids or a category."""
+    clauses = [Product.user_id == user_id, Product.deleted_at.is_(None)]
+    if data.get('ids'):
+        ids = data['ids']
+        if not isinstance(ids, list) or len(ids) > MAX_IDS:
+            raise BulkUpdateError(f'ids must be a list of at most {MAX_IDS} product ids')
+        try:
+            clauses.append(Product.id.in_([int(i) for i in ids]))
+        except (TypeError, ValueError):
+            raise BulkUpdateError('ids must be product ids')
+    elif data.get('category'):
+        clauses.append(Product.category == data['category'])
+    else:
+        raise BulkUpdateError('Give either ids or a category')
+    return clauses
+
+
+def update_values(data):
+    """Column -> value/expression for the UPDATE, from "set" and "price_change"."""
+    values = {}
+    settings = data.get('set') or {}
+    if not isinstance(settings, dict):
+        raise BulkUpdateError('set must be an object')
+    for field, value in settings.items():
+        if field not in SETTABLE:
+            raise BulkUpdateError(f'{field} cannot be bulk-updated')
+        if field in PRICE_FIELDS:
+            value = _number(value, field)
+            if value < 0:
+                raise BulkUpdateError(f'{field} cannot be negative')
+        values[field] = value
+
+    change = data.get('price_change')
+    if change:
+        if not isinstance(change, dict):
+            raise BulkUpdateError('price_change must be an object')
+        fields = PRICE_FIELDS if change.get('field', 'selling_price') == 'both' else (change.get('field', 'selling_price'),)
+        if any(f not in PRICE_FIELDS for f in fields):
+            raise BulkUpdateError('price_change.field must be selling_price, buying_price or both')
+        if ('percent' in change) == ('amount' in change):
+            raise BulkUpdateError('price_change needs exactly one of percent or amount')
+        round_to = _number(change.get('round_to', 0), 'round_to')
+        for field in fields:
+            if field in values:
+                raise BulkUpdateError(f'{field} is both set and changed')
+            column = getattr(Product, field)
+            if 'percent' in change:
+                percent = _number(change['percent'], 'percent')
+                if percent < -100:
+                    raise BulkUpdateError('percent cannot be below -100')
+                new = column * (1 + percent / 100)
+            else:
+                new = column + _number(change['amount'], 'amount')
+            if round_to > 0:
+                new = func.round(new / round_to) * round_to
+            values[field] = case((new < 0, 0), else_=new)
+
+    if not values:
+        raise BulkUpdateError('Nothing to update: give "set" and/or "price_change"')
+    return values
+
+
+def bulk_update(user_id, data):
+    """Apply one set-based UPDATE to the targeted products and bump the catalog version once.
+
+    Raises BulkUpdateError; the caller commits.
+    """
+    if not isinstance(data, dict):
+        raise BulkUpdateError('Body must be a JSON object')
+    clauses = target_filter(user_id, data)
+    values = update_values(data)
+
+    product_ids = [pid for (pid,) in db.session.query(Product.id).filter(*clauses).all()]
+    if not product_ids:
+        return {'matched': 0, 'catalog_version': None}
+    db.session.execute(
+        update(Product)
+        .where(Product.user_id == user_id, Product.id.in_(product_ids))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    version = mark_changed(user_id, product_ids)
+    return {'matched': len(product_ids), 'catalog_version': version}
@@ -0,0 +1,69 @@
+from models import db, Product, CatalogVersion, CatalogChange
+from utils.db import upsert
+
+
+def serialize_product(p):
+    return {
+        'id': p.id,
+        'name': p.name,
+        'model_number': p.model_number,
+        'barcode': p.barcode,
+        'buying_price': p.buying_price,
+        'selling_price': p.selling_price,
+        'stock': p.stock,
+        'category': p.category
+    }
+
+
+def current_version(user_id):
+    return db.session.query(CatalogVersion.version).filter_by(user_id=user_id).scalar() or 0
+
+
+def mark_changed(user_id, product_ids, deleted=False):
+    """Bump the user's catalog version once and stamp the given products with it.
+
+    The version row stays locked until the caller commits, so concurrent
+    writers for the same shop get distinct, ordered versions.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return current_version(user_id)
+
+    upsert(CatalogVersion, [{'user_id': user_id, 'version': 1}], keys=('user_id',), increment=('version',))
+    version = current_version(user_id)
+    upsert(CatalogChange, [{
+        'user_id': user_id,
+        'product_id': product_id,
+        'version': version,
+        'deleted': deleted
+    } for product_id in product_ids], keys=('user_id', 'product_id'), replace=('version', 'deleted'))
+    return version
+
+
+def changes_since(user_id, since):
+    """Products changed or deleted after `since`; since=0 returns the full catalog."""
+    version = current_version(user_id)
+    if since <= 0:
+        products = Product.query.filter_by(user_id=user_id, deleted_at=None).all()
+        return {'version': version, 'full': True, 'products': [serialize_product(p) for p in products], 'deleted': []}
+
+    changes = CatalogChange.query.filter(
+        CatalogChange.user_id == user_id,
+        CatalogChange.version > since
+    ).all()
+    deleted = [c.product_id for c in changes if c.deleted]
+    changed = [c.product_id for c in changes if not c.deleted]
+    products = Product.query.filter(
+        Product.user_id == user_id,
+        Product.id.in_(changed)
+    ).all() if changed else []
+    return {'version': version, 'full': False, 'products': [serialize_product(p) for p in products],
+            'deleted': deleted}
+
+
+def stock_levels(user_id, product_ids):
+    rows = db.session.query(Product.id, Product.stock).filter(
+        Product.user_id == user_id,
+        Product.id.in_(list(product_ids))
+    ).all()
+    return {product_id: stock for product_id, stock in rows}
@@ -0,0 +1,50 @@
+import csv
+import io
+from datetime import date
+from flask import Response, stream_with_context
+from models import db
+from utils import timewindow
+
+# Exports stream: rows come off a server-side cursor in batches and leave as
+# CSV chunks, so memory stays flat however many rows there are.
+
+YIELD_PER = 1000
+
+
+def parse_export_window(args):
+    """TimeWindow from optional ?from=&to= local dates, or None for all time. Raises ValueError."""
+    start, last = args.get('from'), args.get('to')
+    if not start and not last:
+        return None
+    try:
+        start = date.fromisoformat(start) if start else date(2000, 1, 1)
+        last = date.fromisoformat(last) if last else timewindow.local_today()
+    except ValueError:
+        raise ValueError('from and to must be dates (YYYY-MM-DD)')
+    if last < start:
+        raise ValueError('to must not be before from')
+    return timewindow.between(start, last)
+
+
+def stream_rows(query):
+    """Execute a Core/ORM select on a server-side cursor, fetching YIELD_PER rows at a time."""
+    return db.session.execute(query.execution_options(stream_results=True, yield_per=YIELD_PER))
+
+
+def csv_chunks(header, rows, chunk_rows=500):
+    """Generate CSV text in chunks of `chunk_rows` rows; the csv module does the quoting."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(filename, header, rows):
+    return Response(stream_with_context(csv_chunks(header, rows)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
@@ -0,0 +1,32 @@
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from models import db
+
+
+def upsert(model, rows, keys, increment=(), replace=()):
+    """Insert rows, or on a key clash add the `increment` columns and overwrite the `replace` ones.
+
+    Runs as a single INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT statement so
+    concurrent writers never lose an update.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        updates = {c: table.c[c] + stmt.inserted[c] for c in increment}
+        updates.update({c: stmt.inserted[c] for c in replace})
+        if not updates:
+            updates = {keys[0]: table.c[keys[0]]}
+        stmt = stmt.on_duplicate_key_update(**updates)
+    else:
+        stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        updates = {c: table.c[c] + stmt.excluded[c] for c in increment}
+        updates.update({c: stmt.excluded[c] for c in replace})
+        if updates:
+            stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=updates)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(keys))
+
+    db.session.execute(stmt, rows)
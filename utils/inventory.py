@@ -0,0 +1,153 @@
+from datetime import datetime
+from sqlalchemy import func, insert, select, update, literal
+from models import db, Product, StockMovement, StockSnapshot
+from utils.jobs import job
+
+MOVEMENT_KINDS = ('sale', 'restock', 'adjustment', 'return')
+
+# Product.stock stays the fast "stock now" number. Every change to it is also
+# appended to stock_movements, and stock_snapshots periodically freezes the
+# whole catalog, so stock at any past moment is the nearest snapshot plus the
+# movements since - a bounded window rather than a replay of all history.
+# worker.py queues take_snapshots daily; `flask snapshot-stock` runs it by hand.
+
+
+class StockAdjustmentError(Exception):
+    pass
+
+
+class StockConflictError(StockAdjustmentError):
+    """Stock changed (e.g. a sale) since the client read the value it is replacing."""
+    def __init__(self, current):
+        super().__init__(f'Stock changed to {current} while you were editing')
+        self.current = current
+
+
+def record_movements(user_id, deltas, kind, sale_id=None, note=None, created_at=None):
+    """Append {product_id: signed quantity} to the ledger with one INSERT."""
+    created_at = created_at or datetime.utcnow()
+    rows = [{
+        'user_id': user_id,
+        'product_id': product_id,
+        'kind': kind,
+        'quantity': quantity,
+        'sale_id': sale_id,
+        'note': note,
+        'created_at': created_at
+    } for product_id, quantity in deltas.items() if quantity]
+    if rows:
+        db.session.execute(insert(StockMovement), rows)
+
+
+def record_sale_movements(sales):
+    # Stamped when stock actually changes, not with the (possibly backdated) sale
+    # time: an offline sale uploaded after a snapshot must still count after it
+    created_at = datetime.utcnow()
+    rows = [{
+        'user_id': sale.user_id,
+        'product_id': line['product_id'],
+        'kind': 'sale',
+        'quantity': -line['quantity'],
+        'sale_id': sale.id,
+        'note': None,
+        'created_at': created_at
+    } for sale in sales for line in sale.items]
+    if rows:
+        db.session.execute(insert(StockMovement), rows)
+
+
+def adjust_stock(user_id, product_id, delta, kind, note=None):
+    """Atomically add `delta` to a product's stock and log it. Refuses to go below zero."""
+    if kind not in MOVEMENT_KINDS or kind == 'sale':
+        raise StockAdjustmentError('kind must be restock, adjustment or return')
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id,
+               Product.user_id == user_id,
+               Product.stock + delta >= 0)
+        .values(stock=Product.stock + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise StockAdjustmentError('Stock cannot go below zero')
+    record_movements(user_id, {product_id: delta}, kind, note=note)
+
+
+def set_stock(user_id, product, new_stock, expected=None, note='Stock edited'):
+    """Replace a product's stock, but only if it still equals `expected` (the value the editor saw).
+
+    Raises StockConflictError when it has changed, so a sale made while the edit
+    form was open is not silently overwritten. Without `expected` the stock
+    loaded in this request is used, which only guards against concurrent writers.
+    """
+    expected = (product.stock or 0) if expected is None else expected
+    if new_stock == expected:
+        # Stock left as it was shown; whatever happened to it since stands
+        return
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product.id,
+               Product.user_id == user_id,
+               func.coalesce(Product.stock, 0) == expected)
+        .values(stock=new_stock)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        current = db.session.query(Product.stock).filter(Product.id == product.id).scalar()
+        raise StockConflictError(current or 0)
+    record_movements(user_id, {product.id: new_stock - expected}, 'adjustment', note=note)
+
+
+@job(name='inventory.take_snapshots', max_attempts=1, every=24 * 3600)
+def take_snapshots(user_id=None):
+    """Freeze current stock and unit cost for every product (of one user, or everyone)."""
+    taken_at = datetime.utcnow()
+    products = select(Product.user_id, Product.id, Product.stock, Product.buying_price, literal(taken_at))
+    if user_id is not None:
+        products = products.where(Product.user_id == user_id)
+    db.session.execute(insert(StockSnapshot).from_select(
+        ['user_id', 'product_id', 'stock', 'unit_cost', 'taken_at'], products))
+    db.session.commit()
+    return taken_at
+
+
+def _movement_totals(user_id, after, until=None):
+    query = db.session.query(
+        StockMovement.product_id, func.sum(StockMovement.quantity)
+    ).filter(
+        StockMovement.user_id == user_id,
+        StockMovement.created_at > after
+    )
+    if until is not None:
+        query = query.filter(StockMovement.created_at <= until)
+    return dict(query.group_by(StockMovement.product_id).all())
+
+
+def stock_at(user_id, when):
+    """{product_id: (stock, unit_cost)} as of `when` (naive UTC); deleted products read zero after deletion."""
+    products = {p.id: p for p in Product.query.filter_by(user_id=user_id).all()}
+
+    snapshot_time = db.session.query(func.max(StockSnapshot.taken_at)).filter(
+        StockSnapshot.user_id == user_id,
+        StockSnapshot.taken_at <= when
+    ).scalar()
+
+    if snapshot_time is None:
+        # Before the first snapshot: walk back from the live numbers
+        later = _movement_totals(user_id, when)
+        return {pid: ((p.stock or 0) - later.get(pid, 0), p.buying_price) for pid, p in products.items()}
+
+    snapshot = {s.product_id: s for s in StockSnapshot.query.filter_by(user_id=user_id, taken_at=snapshot_time)}
+    since = _movement_totals(user_id, snapshot_time, when)
+    levels = {}
+    for pid, p in products.items():
+        snap = snapshot.get(pid)
+        base = snap.stock if snap else 0
+        cost = snap.unit_cost if snap else p.buying_price
+        levels[pid] = (base + since.get(pid, 0), cost)
+    return levels
+
+
+def valuation(levels):
+    """Value of stock_at() levels at their unit cost; oversold (negative) lines count as zero."""
+    return sum(max(stock, 0) * (cost or 0) for stock, cost in levels.values())
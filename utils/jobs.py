@@ -0,0 +1,124 @@
+import traceback
+from datetime import datetime, timedelta
+from functools import wraps
+from sqlalchemy import update, or_
+from config import Config
+from models import db, Job
+
+# Work that the response does not need is handed to worker.py through the
+# jobs table. Enqueueing adds a row to the caller's transaction, so a job
+# only exists if the request that created it committed.
+#
+#     @job()
+#     def export_sales(user_id): ...
+#
+#     export_sales.delay(current_user.id)   # then commit as usual
+#
+# Jobs registered with `every=` seconds are also queued by the worker itself
+# (schedule_periodic) once their last run is that old, instead of from cron.
+
+TASKS = {}
+PERIODIC = {}  # job name -> seconds between runs
+
+
+def job(name=None, max_attempts=3, every=None):
+    """Register a function as a job; adds `.delay(*args, **kwargs)` (arguments must be JSON-serialisable)."""
+    def decorator(fn):
+        task_name = name or f'{fn.__module__}.{fn.__name__}'
+        TASKS[task_name] = fn
+        if every:
+            PERIODIC[task_name] = every
+
+        @wraps(fn)
+        def delay(*args, **kwargs):
+            run_at = kwargs.pop('_run_at', None) or datetime.utcnow()
+            row = Job(name=task_name, args=list(args), kwargs=kwargs, max_attempts=max_attempts, run_at=run_at)
+            db.session.add(row)
+            db.session.flush()
+            return row
+
+        fn.delay = delay
+        fn.job_name = task_name
+        return fn
+    return decorator
+
+
+def schedule_periodic():
+    """Queue every periodic job that is not waiting and was last queued more than its interval ago."""
+    now = datetime.utcnow()
+    queued = []
+    for name, every in PERIODIC.items():
+        recent = db.session.query(Job.query.filter(
+            Job.name == name,
+            or_(Job.status.in_(('queued', 'running')), Job.created_at > now - timedelta(seconds=every))
+        ).exists()).scalar()
+        if not recent:
+            TASKS[name].delay()
+            queued.append(name)
+    db.session.commit()
+    return queued
+
+
+def claim(limit, worker_id):
+    """Lease up to `limit` due jobs to this worker and return their ids.
+
+    Expired leases of "running" jobs count as due, so a job whose worker was
+    killed is picked up again.
+    """
+    now = datetime.utcnow()
+    rows = Job.query.filter(
+        Job.status.in_(('queued', 'running')),
+        Job.run_at <= now
+    ).order_by(Job.run_at).limit(limit).with_for_update(skip_locked=True).all()
+    for row in rows:
+        row.status = 'running'
+        row.attempts += 1
+        row.locked_by = worker_id
+        row.run_at = now + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+    db.session.commit()
+    return [row.id for row in rows]
+
+
+def extend_leases(job_ids, worker_id):
+    """Heartbeat: push out the lease of jobs this worker is still running. Returns how many were extended."""
+    if not job_ids:
+        return 0
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.locked_by == worker_id, Job.status == 'running')
+        .values(run_at=datetime.utcnow() + timedelta(seconds=Config.JOB_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def run_job(job_id):
+    """Execute one claimed job and record the outcome; needs an app context."""
+    row = db.session.get(Job, job_id)
+    fn = TASKS.get(row.name)
+    try:
+        if fn is None:
+            raise LookupError(f'No job registered as {row.name}')
+        result = fn(*(row.args or []), **(row.kwargs or {}))
+    except Exception:
+        db.session.rollback()
+        row = db.session.get(Job, job_id)
+        row.last_error = traceback.format_exc()[-4000:]
+        if row.attempts >= row.max_attempts:
+            row.status = 'failed'
+            row.finished_at = datetime.utcnow()
+        else:
+            row.status = 'queued'
+            # 30s, 60s, 120s...
+            row.run_at = datetime.utcnow() + timedelta(seconds=30 * 2 ** (row.attempts - 1))
+        db.session.commit()
+        return False
+
+    row = db.session.get(Job, job_id)
+    row.status = 'done'
+    row.result = result if isinstance(result, (dict, list, str, int, float, bool)) else None
+    row.finished_at = datetime.utcnow()
+    row.last_error = None
+    db.session.commit()
+    return True
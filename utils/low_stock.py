@@ -0,0 +1,85 @@
+from sqlalchemy import update, case, func
+from models import db, Product, UserSettings, Message
+from utils.sms import queue_sms, format_message
+
+DEFAULT_THRESHOLD = 10
+
+# Product.low_stock is a precomputed "stock <= the shop's threshold" flag.
+# Writers that move stock call refresh_low_stock() for the products they
+# touched; it only writes when a product crosses the threshold, and sends one
+# alert per crossing batch. New products start with the flag already right and
+# never alert. Readers (the dashboard) just read the flag.
+
+
+def threshold_for(settings):
+    if settings and settings.low_stock_threshold is not None:
+        return settings.low_stock_threshold
+    return DEFAULT_THRESHOLD
+
+
+def refresh_low_stock(user_id, product_ids):
+    """Flip the flag on products that crossed the threshold; alert on the ones that went low."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    settings = UserSettings.query.filter_by(user_id=user_id).first()
+    threshold = threshold_for(settings)
+
+    rows = db.session.query(Product.id, Product.name, Product.stock, Product.low_stock).filter(
+        Product.user_id == user_id,
+        Product.id.in_(product_ids)
+    ).all()
+    went_low = [r for r in rows if (r.stock or 0) <= threshold and not r.low_stock
+                and _flag_low(user_id, r.id, threshold)]
+    recovered = [r.id for r in rows if (r.stock or 0) > threshold and r.low_stock]
+
+    if recovered:
+        db.session.execute(
+            update(Product)
+            .where(Product.user_id == user_id, Product.id.in_(recovered), func.coalesce(Product.stock, 0) > threshold)
+            .values(low_stock=False)
+            .execution_options(synchronize_session=False)
+        )
+    if went_low and (settings is None or settings.low_stock_alert_enabled):
+        _alert(user_id, settings, threshold, went_low)
+    return [r.id for r in went_low]
+
+
+def _flag_low(user_id, product_id, threshold):
+    """Set the flag only while it is still clear; of two concurrent sales only one gets rowcount 1 and alerts."""
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id,
+               Product.user_id == user_id,
+               Product.low_stock.is_(False),
+               func.coalesce(Product.stock, 0) <= threshold)
+        .values(low_stock=True)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def starts_low(user_id, stock):
+    """Flag for a product created with `stock`: set, but nothing crossed, so no alert."""
+    return (stock or 0) <= threshold_for(UserSettings.query.filter_by(user_id=user_id).first())
+
+
+def _alert(user_id, settings, threshold, products):
+    names = ', '.join(f'{p.name} ({p.stock or 0})' for p in products)
+    subject = 'Low stock alert'
+    content = f'{len(products)} product(s) at or below {threshold} in stock: {names}'
+    db.session.add(Message(user_id=user_id, sender='system', subject=subject, content=content))
+    if settings and settings.sms_reminders_enabled:
+        phone = settings.sms_phone_number or settings.user.phone
+        if phone:
+            queue_sms(phone, format_message(subject, content), user_id)
+
+
+def reflag_all(user_id, threshold):
+    """Recompute every flag for one shop after its threshold changed (no alerts)."""
+    db.session.execute(
+        update(Product)
+        .where(Product.user_id == user_id, Product.deleted_at.is_(None))
+        .values(low_stock=case((Product.stock <= threshold, True), else_=False))
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,55 @@
+from sqlalchemy import func, case
+from models import db, Product, DailySalesRollup, DailyExpenseRollup
+from utils import timewindow
+
+
+def sum_if(condition, column):
+    """SUM(CASE WHEN condition THEN column ELSE 0 END), 0 when there are no rows."""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+def dashboard_metrics(user_id):
+    """Today's and this month's figures with one conditional-aggregate statement per table."""
+    today = timewindow.today()
+    month = timewindow.this_month()
+
+    sales = db.session.query(
+        sum_if(DailySalesRollup.day == today.start_day, DailySalesRollup.sales_total).label('today_sales'),
+        sum_if(DailySalesRollup.day == today.start_day, DailySalesRollup.profit_total).label('today_profit'),
+        sum_if(DailySalesRollup.day == today.start_day, DailySalesRollup.sale_count).label('today_count'),
+        func.coalesce(func.sum(DailySalesRollup.sales_total), 0).label('month_sales'),
+        func.coalesce(func.sum(DailySalesRollup.profit_total), 0).label('month_profit'),
+        func.coalesce(func.sum(DailySalesRollup.sale_count), 0).label('month_count')
+    ).filter(
+        DailySalesRollup.user_id == user_id,
+        month.day_filter(DailySalesRollup.day)
+    ).one()
+
+    expenses = db.session.query(
+        sum_if(DailyExpenseRollup.day == today.start_day, DailyExpenseRollup.amount).label('today_expenses'),
+        func.coalesce(func.sum(DailyExpenseRollup.amount), 0).label('month_expenses')
+    ).filter(
+        DailyExpenseRollup.user_id == user_id,
+        month.day_filter(DailyExpenseRollup.day)
+    ).one()
+
+    products = db.session.query(
+        func.count(Product.id).label('products_count'),
+        sum_if(Product.low_stock.is_(True), 1).label('low_stock_count')
+    ).filter(
+        Product.user_id == user_id,
+        Product.deleted_at.is_(None)
+    ).one()
+
+    return {
+        'today_sales': float(sales.today_sales),
+        'today_profit': float(sales.today_profit),
+        'today_count': int(sales.today_count),
+        'today_expenses': float(expenses.today_expenses),
+        'month_sales': float(sales.month_sales),
+        'month_profit': float(sales.month_profit),
+        'month_count': int(sales.month_count),
+        'month_expenses': float(expenses.month_expenses),
+        'products_count': int(products.products_count),
+        'low_stock_count': int(products.low_stock_count)
+    }
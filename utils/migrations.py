@@ -0,0 +1,141 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import db, SchemaMigration
+
+# Versioned schema changes for databases that already exist.
+# db.create_all() only creates missing tables, so anything that alters an
+# existing table (new index, new column) must be registered here as well as
+# in models.py. Steps must be idempotent: a fresh database created from the
+# models already has the change and the step just records its version.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def has_index(conn, table, name):
+    return any(index['name'] == name for index in inspect(conn).get_indexes(table))
+
+
+def has_column(conn, table, name):
+    return any(column['name'] == name for column in inspect(conn).get_columns(table))
+
+
+def add_index(conn, table, name, columns):
+    """Create an index without blocking writes (InnoDB online DDL on MySQL)."""
+    if has_index(conn, table, name):
+        return
+    cols = ', '.join(columns)
+    if conn.dialect.name == 'mysql':
+        conn.execute(text(f'ALTER TABLE {table} ADD INDEX {name} ({cols}), ALGORITHM=INPLACE, LOCK=NONE'))
+    else:
+        conn.execute(text(f'CREATE INDEX {name} ON {table} ({cols})'))
+
+
+def add_column(conn, table, name, ddl):
+    """Add a column; `ddl` is the type and default clause, e.g. 'BOOLEAN NOT NULL DEFAULT 0'."""
+    if has_column(conn, table, name):
+        return
+    if conn.dialect.name == 'mysql':
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}, ALGORITHM=INPLACE, LOCK=NONE'))
+    else:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+
+
+def applied_versions():
+    return {v for (v,) in db.session.query(SchemaMigration.version).all()}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def upgrade(echo=print):
+    """Apply pending migrations in order, recording each version as soon as its step finishes.
+
+    MySQL commits DDL implicitly, which is why every step has to be safe to re-run.
+    """
+    for version, description, fn in pending_migrations():
+        echo(f'Applying {version:04d}: {description}')
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()))
+
+
+@migration(1, 'Tenant-scoped composite indexes')
+def tenant_indexes(conn):
+    add_index(conn, 'sales', 'ix_sales_user_created', ['user_id', 'created_at'])
+    add_index(conn, 'expenses', 'ix_expenses_user_created', ['user_id', 'created_at'])
+    add_index(conn, 'payments', 'ix_payments_user_created', ['user_id', 'created_at'])
+    add_index(conn, 'messages', 'ix_messages_user_sender_read', ['user_id', 'sender', 'is_read'])
+    add_index(conn, 'products', 'ix_products_user_barcode', ['user_id', 'barcode'])
+    add_index(conn, 'products', 'ix_products_user_stock', ['user_id', 'stock'])
+
+
+@migration(2, 'Platform-wide day index on daily sales rollups')
+def daily_sales_day_index(conn):
+    add_index(conn, 'daily_sales_rollups', 'ix_daily_sales_rollups_day', ['day'])
+
+
+@migration(3, 'Precomputed low-stock flag on products')
+def product_low_stock_flag(conn):
+    add_column(conn, 'products', 'low_stock', 'BOOLEAN NOT NULL DEFAULT 0')
+    add_index(conn, 'products', 'ix_products_user_low_stock', ['user_id', 'low_stock'])
+    conn.execute(text(
+        'UPDATE products SET low_stock = CASE WHEN stock <= COALESCE('
+        '(SELECT low_stock_threshold FROM user_settings WHERE user_settings.user_id = products.user_id), 10'
+        ') THEN 1 ELSE 0 END'
+    ))
+
+
+@migration(4, 'Product search indexes')
+def product_search_indexes(conn):
+    add_index(conn, 'products', 'ix_products_user_name', ['user_id', 'name'])
+    add_index(conn, 'products', 'ix_products_user_model', ['user_id', 'model_number'])
+    if conn.dialect.name == 'mysql' and not has_index(conn, 'products', 'ft_products_search'):
+        # InnoDB cannot build the first FULLTEXT index with LOCK=NONE; reads keep working meanwhile
+        conn.execute(text('ALTER TABLE products ADD FULLTEXT INDEX ft_products_search '
+                          '(name, model_number, category), ALGORITHM=INPLACE, LOCK=SHARED'))
+
+
+@migration(5, 'Platform-wide created_at index on payments for admin exports')
+def payments_created_index(conn):
+    add_index(conn, 'payments', 'ix_payments_created', ['created_at'])
+
+
+@migration(6, 'Keyset pagination indexes on (..., created_at)')
+def keyset_indexes(conn):
+    add_index(conn, 'users', 'ix_users_created_at', ['created_at'])
+    add_index(conn, 'products', 'ix_products_user_created', ['user_id', 'created_at'])
+    add_index(conn, 'messages', 'ix_messages_user_created', ['user_id', 'created_at'])
+    add_index(conn, 'messages', 'ix_messages_sender_created', ['sender', 'created_at'])
+
+
+@migration(7, 'Admin console filter and search indexes')
+def admin_search_indexes(conn):
+    add_index(conn, 'users', 'ix_users_status_created', ['subscription_status', 'created_at'])
+    add_index(conn, 'users', 'ix_users_business_name', ['business_name'])
+    add_index(conn, 'users', 'ix_users_phone', ['phone'])
+    add_index(conn, 'payments', 'ix_payments_status_created', ['status', 'created_at'])
+    add_index(conn, 'payments', 'ix_payments_transaction_ref', ['transaction_ref'])
+    add_index(conn, 'payments', 'ix_payments_payer_phone', ['payer_phone'])
+
+
+@migration(8, 'Double precision rate-limit bucket columns')
+def rate_limit_double(conn):
+    # SQLite stores REAL as 8 bytes already; only MySQL declared these as FLOAT
+    if conn.dialect.name == 'mysql':
+        conn.execute(text('ALTER TABLE rate_limit_buckets '
+                          'MODIFY tokens DOUBLE NOT NULL, MODIFY updated_at DOUBLE NOT NULL'))
+
+
+@migration(9, 'Soft delete for products')
+def product_soft_delete(conn):
+    add_column(conn, 'products', 'deleted_at', 'DATETIME NULL')
@@ -0,0 +1,76 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from flask import request, url_for
+from sqlalchemy import and_, or_, DateTime
+
+# Keyset pagination: pages are "rows older than the last one you saw",
+# ordered by (created_at, id) newest first. Each page is an index range scan
+# on (..., created_at) whatever its depth, unlike OFFSET which reads and
+# discards every earlier row.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Raises ValueError on anything that is not a cursor we issued."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page_args(default=DEFAULT_LIMIT):
+    """(cursor, limit) from the query string, with the limit capped at MAX_LIMIT."""
+    limit = request.args.get('limit', default, type=int)
+    return request.args.get('cursor') or None, max(1, min(limit, MAX_LIMIT))
+
+
+def keyset_page(query, model, cursor=None, limit=DEFAULT_LIMIT, key=None, descending=True):
+    """One page of `query` ordered by (key, model.id), newest created_at first by default.
+
+    `key` must be a non-null column; raises ValueError on a bad cursor.
+    """
+    key = model.created_at if key is None else key
+    ident = model.id
+    if cursor:
+        try:
+            last_key, last_id = decode_cursor(cursor)
+            if isinstance(key.type, DateTime):
+                last_key = datetime.fromisoformat(last_key)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        if descending:
+            query = query.filter(or_(key < last_key, and_(key == last_key, ident < last_id)))
+        else:
+            query = query.filter(or_(key > last_key, and_(key == last_key, ident > last_id)))
+    order = (key.desc(), ident.desc()) if descending else (key.asc(), ident.asc())
+    items = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last_key = getattr(items[-1], key.key)
+        if isinstance(last_key, datetime):
+            last_key = last_key.isoformat()
+        next_cursor = encode_cursor([last_key, items[-1].id])
+    return Page(items, next_cursor)
+
+
+def with_next_cursor(response, page):
+    """Attach the next page to a JSON list response without changing its body shape."""
+    if page.next_cursor:
+        response.headers['X-Next-Cursor'] = page.next_cursor
+        args = dict(request.args, cursor=page.next_cursor)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **(request.view_args or {}), **args)}>; rel="next"'
+    return response
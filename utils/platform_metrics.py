@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, and_, or_
+from config import Config
+from models import db, User, Payment, Message, DailySalesRollup, PlatformMetrics, Job
+from utils import timewindow
+from utils.db import upsert
+from utils.jobs import job
+from utils.metrics import sum_if
+
+# The admin dashboard reads one platform_metrics row instead of counting and
+# summing users, payments, sales and messages across every tenant per page
+# load. Rows are recomputed by the refresh job (queued when the dashboard sees
+# a stale row, or run from cron with `flask refresh-platform-metrics`), and
+# the per-day rows double as the growth history. The queued job needs
+# worker.py; if today's row stays stale anyway, the dashboard recomputes it.
+
+POINT_IN_TIME = ('users_active', 'users_trial', 'pending_payments', 'unread_messages')
+
+
+def collect(day):
+    """Figures for local `day`. Point-in-time counts are only taken for today."""
+    start, end = timewindow.to_utc(day), timewindow.to_utc(day + timedelta(days=1))
+    live = day == timewindow.local_today()
+
+    users = db.session.query(
+        func.count(User.id).label('total'),
+        sum_if(User.created_at >= start, 1).label('new'),
+        sum_if(User.subscription_status == 'active', 1).label('active'),
+        sum_if(User.subscription_status == 'trial', 1).label('trial')
+    ).filter(User.created_at < end).one()
+
+    payments = db.session.query(
+        sum_if(Payment.status == 'pending', 1).label('pending'),
+        sum_if(and_(Payment.status == 'verified',
+                     or_(Payment.verified_at.is_(None), Payment.verified_at < end)),
+                Payment.amount).label('revenue')
+    ).one()
+
+    sales = db.session.query(
+        func.coalesce(func.sum(DailySalesRollup.sales_total), 0).label('sales'),
+        func.coalesce(func.sum(DailySalesRollup.profit_total), 0).label('profit'),
+        func.coalesce(func.sum(DailySalesRollup.sale_count), 0).label('count')
+    ).filter(DailySalesRollup.day == day).one()
+
+    row = {
+        'day': day,
+        'users_total': int(users.total),
+        'new_users': int(users.new),
+        'verified_revenue': float(payments.revenue),
+        'sales_total': float(sales.sales),
+        'profit_total': float(sales.profit),
+        'sale_count': int(sales.count),
+        'refreshed_at': datetime.utcnow()
+    }
+    if live:
+        row.update({
+            'users_active': int(users.active),
+            'users_trial': int(users.trial),
+            'pending_payments': int(payments.pending),
+            'unread_messages': Message.query.filter_by(sender='user', is_read=False).count()
+        })
+    else:
+        row.update(dict.fromkeys(POINT_IN_TIME))
+    return row
+
+
+def refresh(day=None):
+    """Recompute and store one day's row (default today). Does not commit."""
+    day = day or timewindow.local_today()
+    row = collect(day)
+    # A backfill must not wipe the point-in-time counts a live refresh recorded
+    live = day == timewindow.local_today()
+    replace = [c for c in row if c != 'day' and (live or c not in POINT_IN_TIME)]
+    upsert(PlatformMetrics, [row], keys=['day'], replace=replace)
+    return row
+
+
+@job(name='platform_metrics.refresh_due', max_attempts=1)
+def refresh_due():
+    """Refresh today, and yesterday too until it has been refreshed after it ended."""
+    today = timewindow.local_today()
+    yesterday = db.session.get(PlatformMetrics, today - timedelta(days=1))
+    if yesterday is None or yesterday.refreshed_at < timewindow.to_utc(today):
+        refresh(today - timedelta(days=1))
+    refresh(today)
+    db.session.commit()
+
+
+def queue_refresh():
+    """Queue refresh_due unless one is already waiting. Joins the caller's transaction."""
+    pending = db.session.query(Job.query.filter(
+        Job.name == refresh_due.job_name,
+        Job.status.in_(('queued', 'running'))
+    ).exists()).scalar()
+    if not pending:
+        refresh_due.delay()
+
+
+def current():
+    """Latest row for the dashboard.
+
+    A new day, or a row the background refresh has left stale for longer than
+    PLATFORM_METRICS_MAX_STALE (no worker running), is computed inline; a row
+    merely older than PLATFORM_METRICS_MAX_AGE is refreshed in the background.
+    """
+    row = PlatformMetrics.query.order_by(PlatformMetrics.day.desc()).first()
+    now = datetime.utcnow()
+    if row is None or row.day != timewindow.local_today() or \
+            row.refreshed_at < now - timedelta(seconds=Config.PLATFORM_METRICS_MAX_STALE):
+        refresh_due()
+        return PlatformMetrics.query.order_by(PlatformMetrics.day.desc()).first()
+    if row.refreshed_at < now - timedelta(seconds=Config.PLATFORM_METRICS_MAX_AGE):
+        queue_refresh()
+        db.session.commit()
+    return row
+
+
+def history(days):
+    """Stored rows for the last `days` local days, oldest first (days never refreshed are absent)."""
+    window = timewindow.last_n_days(days)
+    return PlatformMetrics.query.filter(
+        window.day_filter(PlatformMetrics.day)
+    ).order_by(PlatformMetrics.day).all()
+
+
+def backfill(days):
+    """Rebuild the last `days` rows from users, payments and the sales rollups."""
+    today = timewindow.local_today()
+    for offset in range(days - 1, -1, -1):
+        refresh(today - timedelta(days=offset))
+    db.session.commit()
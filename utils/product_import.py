@@ -0,0 +1,218 @@
+import csv
+import io
+from sqlalchemy import func, insert, update, or_
+from config import Config
+from models import db, Product, UserSettings
+from utils.catalog import mark_changed
+from utils.inventory import record_movements
+from utils.low_stock import threshold_for, refresh_low_stock
+
+# Header spellings people actually use in spreadsheets, mapped to Product columns
+HEADER_ALIASES = {
+    'name': 'name', 'product': 'name', 'product_name': 'name',
+    'model_number': 'model_number', 'model': 'model_number', 'model_no': 'model_number',
+    'barcode': 'barcode', 'ean': 'barcode', 'upc': 'barcode',
+    'buying_price': 'buying_price', 'cost': 'buying_price', 'cost_price': 'buying_price',
+    'selling_price': 'selling_price', 'price': 'selling_price',
+    'stock': 'stock', 'quantity': 'stock', 'qty': 'stock',
+    'category': 'category'
+}
+REQUIRED = ('name', 'buying_price', 'selling_price')
+MAX_LENGTHS = {'name': 100, 'model_number': 50, 'barcode': 20, 'category': 50}
+
+
+class CsvImportError(Exception):
+    pass
+
+
+def read_rows(stream):
+    """Yield (line_number, {column: raw value}) from a binary CSV stream, one line at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if not header:
+        raise CsvImportError('The file is empty')
+    columns = [HEADER_ALIASES.get(h.strip().lower().replace(' ', '_')) for h in header]
+    missing = [c for c in REQUIRED if c not in columns]
+    if missing:
+        raise CsvImportError('Missing column(s): ' + ', '.join(missing))
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        row = {c: v.strip() for c, v in zip(columns, values) if c}
+        yield reader.line_num, row
+
+
+def validate_row(raw):
+    """Clean one row against the Product schema; blank optional fields come back as None. Raises ValueError."""
+    row = {}
+    for column, limit in MAX_LENGTHS.items():
+        value = raw.get(column) or None
+        if value and len(value) > limit:
+            raise ValueError(f'{column} is longer than {limit} characters')
+        row[column] = value
+    if not row['name']:
+        raise ValueError('name is required')
+    for column in ('buying_price', 'selling_price'):
+        try:
+            row[column] = float(raw[column].replace(',', ''))
+        except (KeyError, ValueError):
+            raise ValueError(f'{column} must be a number')
+        if row[column] < 0:
+            raise ValueError(f'{column} cannot be negative')
+    stock = raw.get('stock')
+    if stock:
+        try:
+            row['stock'] = int(float(stock.replace(',', '')))
+        except ValueError:
+            raise ValueError('stock must be a whole number')
+        if row['stock'] < 0:
+            raise ValueError('stock cannot be negative')
+    else:
+        row['stock'] = None
+    return row
+
+
+def _existing(user_id, rows):
+    """Products already in the shop that match the batch by barcode or model number."""
+    barcodes = {r['barcode'] for r in rows if r['barcode']}
+    models = {r['model_number'] for r in rows if r['model_number']}
+    if not barcodes and not models:
+        return {}, {}
+    found = db.session.query(
+        Product.id, Product.barcode, Product.model_number, Product.category, Product.stock
+    ).filter(
+        Product.user_id == user_id,
+        Product.deleted_at.is_(None),
+        or_(Product.barcode.in_(barcodes), Product.model_number.in_(models))
+    ).all()
+    by_barcode = {p.barcode: p for p in found if p.barcode}
+    by_model = {p.model_number: p for p in found if p.model_number}
+    return by_barcode, by_model
+
+
+def import_batch(user_id, rows, threshold):
+    """Upsert one batch with one SELECT, one bulk UPDATE and a bulk INSERT. Returns (created, updated)."""
+    by_barcode, by_model = _existing(user_id, rows)
+    updates, inserts = {}, {}
+    for row in rows:
+        match = (row['barcode'] and by_barcode.get(row['barcode'])) or \
+                (row['model_number'] and by_model.get(row['model_number']))
+        if match:
+            stock = match.stock if row['stock'] is None else row['stock']
+            updates[match.id] = {
+                'id': match.id,
+                'name': row['name'],
+                'model_number': row['model_number'] or match.model_number,
+                'barcode': row['barcode'] or match.barcode,
+                'buying_price': row['buying_price'],
+                'selling_price': row['selling_price'],
+                'category': row['category'] or match.category,
+                'stock': stock,
+                '_delta': (stock or 0) - (match.stock or 0)
+            }
+        else:
+            # Repeats of the same product later in the file win
+            key = row['barcode'] or row['model_number'] or row['name']
+            stock = row['stock'] or 0
+            inserts[key] = dict(row, user_id=user_id, stock=stock, low_stock=stock <= threshold)
+
+    if updates:
+        deltas = {pid: u.pop('_delta') for pid, u in updates.items()}
+        db.session.execute(update(Product), list(updates.values()))
+        record_movements(user_id, deltas, 'adjustment', note='CSV import')
+        # Same crossing rules (and alerts) as stock changed any other way
+        refresh_low_stock(user_id, [pid for pid, delta in deltas.items() if delta])
+
+    created_ids = []
+    if inserts:
+        rows = list(inserts.values())
+        created_ids = _insert_products(user_id, rows)
+        record_movements(user_id, {pid: r['stock'] for pid, r in zip(created_ids, rows)}, 'restock',
+                         note='Opening stock (CSV import)')
+
+    mark_changed(user_id, list(updates) + created_ids)
+    return len(inserts), len(updates)
+
+
+def _key(barcode, model_number):
+    return ('barcode', barcode) if barcode else ('model', model_number)
+
+
+def _insert_products(user_id, rows):
+    """Insert new products for one shop and return their ids in `rows` order."""
+    if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.session.execute(insert(Product).returning(Product.id, sort_by_parameter_order=True), rows)
+        return [pid for (pid,) in result]
+
+    # MySQL has no INSERT ... RETURNING. Rows with a barcode or model number go
+    # in one INSERT and are read back by that key (they did not match a live
+    # product, so only this batch can hold it above the previous highest id);
+    # the rest are inserted one at a time to get each id from the cursor.
+    keyed = [r for r in rows if r['barcode'] or r['model_number']]
+    by_key = {}
+    if keyed:
+        last_id = db.session.query(func.max(Product.id)).filter(Product.user_id == user_id).scalar() or 0
+        db.session.execute(insert(Product), keyed)
+        found = db.session.query(Product.id, Product.barcode, Product.model_number).filter(
+            Product.user_id == user_id,
+            Product.id > last_id,
+            Product.deleted_at.is_(None),
+            or_(Product.barcode.in_({r['barcode'] for r in keyed if r['barcode']}),
+                Product.model_number.in_({r['model_number'] for r in keyed if not r['barcode']}))
+        ).order_by(Product.id).all()
+        by_key = {_key(p.barcode, p.model_number): p.id for p in found}
+    ids = []
+    for r in rows:
+        if r['barcode'] or r['model_number']:
+            ids.append(by_key[_key(r['barcode'], r['model_number'])])
+        else:
+            ids.append(db.session.execute(insert(Product).values(**r)).inserted_primary_key[0])
+    return ids
+
+
+def import_products(user_id, stream, batch_size=None):
+    """Stream-import a CSV of products, committing every batch.
+
+    Yields a progress dict after each batch and a final one with "done": True.
+    Errors are reported per CSV line; bad rows are skipped, good ones imported.
+    """
+    batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+    threshold = threshold_for(UserSettings.query.filter_by(user_id=user_id).first())
+    progress = {'processed': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        created, updated = import_batch(user_id, batch, threshold)
+        db.session.commit()
+        progress['created'] += created
+        progress['updated'] += updated
+        batch.clear()
+
+    try:
+        for line, raw in read_rows(stream):
+            progress['processed'] += 1
+            try:
+                batch.append(validate_row(raw))
+            except ValueError as e:
+                progress['failed'] += 1
+                if progress['failed'] <= Config.IMPORT_MAX_ERRORS:
+                    progress['errors'].append({'line': line, 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+                yield _report(progress)
+        if batch:
+            flush()
+    except (CsvImportError, csv.Error, UnicodeDecodeError) as e:
+        db.session.rollback()
+        yield dict(_report(progress), done=True, error=str(e))
+        return
+    yield dict(_report(progress), done=True)
+
+
+def _report(progress):
+    """Progress snapshot; each row error is sent once, in the first report after it happened."""
+    report = dict(progress, errors=list(progress['errors']))
+    progress['errors'].clear()
+    return report
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from models import db, Product, Sale, Expense, Payment, Message, DailySalesRollup, CatalogChange
+
+
+def hot_queries(user_id=1):
+    """The per-tenant queries that run on every page load or sale."""
+    since = datetime.utcnow() - timedelta(days=30)
+    return [
+        ('recent sales', Sale.query.filter(Sale.user_id == user_id).order_by(Sale.created_at.desc()).limit(50)),
+        ('sales in window', Sale.query.filter(Sale.user_id == user_id, Sale.created_at >= since)),
+        ('expense list', Expense.query.filter(Expense.user_id == user_id).order_by(Expense.created_at.desc())),
+        ('billing history', Payment.query.filter(Payment.user_id == user_id).order_by(Payment.created_at.desc())),
+        ('unread messages', Message.query.filter(Message.user_id == user_id, Message.sender == 'admin',
+                                                 Message.is_read.is_(False))),
+        ('barcode lookup', Product.query.filter(Product.user_id == user_id, Product.barcode == '6001234567890')),
+        ('low stock', Product.query.filter(Product.user_id == user_id, Product.stock <= 5)),
+        ('sales rollup', DailySalesRollup.query.filter(DailySalesRollup.user_id == user_id,
+                                                       DailySalesRollup.day >= since.date())),
+        ('catalog delta', CatalogChange.query.filter(CatalogChange.user_id == user_id, CatalogChange.version > 0)),
+    ]
+
+
+def explain(query):
+    """Return (uses_index, plan_text) for a query on the current database."""
+    conn = db.session.connection()
+    compiled = query.statement.compile(dialect=conn.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if conn.dialect.name == 'mysql':
+        rows = conn.exec_driver_sql('EXPLAIN ' + compiled.string, params).mappings().all()
+        plan = '; '.join(f"{r['table']}: key={r['key']} type={r['type']} rows={r['rows']}" for r in rows)
+        return all(r['key'] for r in rows), plan
+
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled.string, params).all()
+        details = [r[-1] for r in rows]
+        uses_index = all('USING' in d and 'INDEX' in d for d in details if d.startswith(('SCAN', 'SEARCH')))
+        return uses_index, '; '.join(details)
+
+    return False, f'EXPLAIN check not implemented for {conn.dialect.name}'
+
+
+def check_hot_queries(user_id=1):
+    return [(label, *explain(query)) for label, query in hot_queries(user_id)]
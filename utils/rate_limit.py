@@ -0,0 +1,141 @@
+import random
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import time
+from flask import request, jsonify, flash, redirect
+from flask_login import current_user
+from sqlalchemy import insert, select, update, case, delete
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models import db, RateLimitBucket
+
+# Token buckets: each key holds up to `capacity` tokens and regains
+# capacity/per tokens a second, so "30 per 60s" allows a burst of 30 and then
+# one request every two seconds.
+
+
+class MemoryStore:
+    """Per-process buckets, bounded: the least recently used keys are evicted first."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now=None):
+        now = time() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class DatabaseStore:
+    """Buckets in the rate_limit_buckets table, so every gunicorn worker shares one limit.
+
+    Runs on its own connection and commits at once, independent of the
+    request's session. Taking a token is one conditional UPDATE, which the
+    database serialises per row.
+    """
+
+    IDLE_SECONDS = 86400
+    PURGE_CHANCE = 0.01
+
+    @staticmethod
+    def _spend(conn, table, key, refilled, now):
+        """True if a token was taken, False if the bucket is empty, None if it does not exist."""
+        result = conn.execute(
+            update(table)
+            .where(table.c.key == key, refilled >= 1)
+            .values(tokens=refilled - 1, updated_at=now)
+        )
+        if result.rowcount == 1:
+            return True
+        exists = conn.execute(select(table.c.key).where(table.c.key == key)).first()
+        return False if exists else None
+
+    def take(self, key, capacity, rate, now=None):
+        now = time() if now is None else now
+        table = RateLimitBucket.__table__
+        refilled = table.c.tokens + (now - table.c.updated_at) * rate
+        refilled = case((refilled > capacity, capacity), else_=refilled)
+
+        with db.engine.begin() as conn:
+            allowed = self._spend(conn, table, key, refilled, now)
+            if allowed is None:
+                try:
+                    # First request for this key: start from a full bucket
+                    with conn.begin_nested():
+                        conn.execute(insert(table).values(key=key, tokens=capacity - 1, updated_at=now))
+                    allowed = True
+                except IntegrityError:
+                    # Another worker created it first; it now exists, so spend from it
+                    allowed = self._spend(conn, table, key, refilled, now)
+            retry_after = 0
+            if not allowed:
+                bucket = conn.execute(select(table).where(table.c.key == key)).one()
+                current = min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+                retry_after = (1 - current) / rate
+            if random.random() < self.PURGE_CHANCE:
+                # Buckets idle this long are full again, which is the same as absent
+                conn.execute(delete(table).where(table.c.updated_at < now - self.IDLE_SECONDS))
+        return allowed, retry_after
+
+
+_stores = {}
+
+
+def get_store():
+    kind = Config.RATE_LIMIT_STORAGE
+    if kind not in _stores:
+        _stores[kind] = MemoryStore(Config.RATE_LIMIT_MEMORY_KEYS) if kind == 'memory' else DatabaseStore()
+    return _stores[kind]
+
+
+def take(name, key, capacity, per):
+    """Spend one token from bucket `name:key`; returns (allowed, seconds until the next token)."""
+    return get_store().take(f'{name}:{key}', capacity, capacity / per)
+
+
+def client_key():
+    """The logged-in user, or the client IP for anonymous requests."""
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return f'ip:{request.remote_addr}'
+
+
+def limited_response(retry_after, message='Too many requests. Please wait a minute.'):
+    """429 for API/JSON callers; forms get the message flashed and are sent back to the page."""
+    if request.path.startswith('/api/') or request.is_json:
+        response = jsonify({'error': message})
+        response.status_code = 429
+    else:
+        flash(message, 'error')
+        response = redirect(request.url)
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+
+def rate_limit(name, capacity, per, key=client_key, methods=None, message=None):
+    """Decorate a view: at most `capacity` requests per `per` seconds for each key.
+
+    `methods` restricts counting to those HTTP methods, e.g. ('POST',) so
+    showing the login form is free and only attempts are limited.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if methods is None or request.method in methods:
+                allowed, retry_after = take(name, key(), capacity, per)
+                if not allowed:
+                    return limited_response(retry_after, *([message] if message else []))
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from models import ReportCache
+from utils.db import upsert
+from utils import timewindow
+from config import Config
+
+# Per-tenant cache of computed range reports. Entries are dropped in the same
+# transaction as any sale or expense that lands inside their range, so every
+# worker sees the invalidation. Ranges that include today also expire after
+# REPORT_CACHE_LIVE_TTL seconds, which covers a report computed while a
+# concurrent sale was still uncommitted.
+
+
+def get(user_id, key, window):
+    entry = ReportCache.query.filter_by(user_id=user_id, cache_key=key).first()
+    if entry is None:
+        return None
+    if window.end_day > timewindow.local_today():
+        if entry.created_at < datetime.utcnow() - timedelta(seconds=Config.REPORT_CACHE_LIVE_TTL):
+            return None
+    return entry.payload
+
+
+def put(user_id, key, window, payload):
+    upsert(ReportCache, [{
+        'user_id': user_id,
+        'cache_key': key,
+        'start_day': window.start_day,
+        'end_day': window.end_day,
+        'payload': payload,
+        'created_at': datetime.utcnow()
+    }], keys=('user_id', 'cache_key'), replace=('start_day', 'end_day', 'payload', 'created_at'))
+
+
+def invalidate(user_id, days):
+    """Drop cached reports whose [start_day, end_day) range covers any of `days`."""
+    for day in set(days):
+        ReportCache.query.filter(
+            ReportCache.user_id == user_id,
+            ReportCache.start_day <= day,
+            ReportCache.end_day > day
+        ).delete(synchronize_session=False)
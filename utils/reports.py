@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+from sqlalchemy import func, exists
+from models import db, Product, DailySalesRollup, ProductDailyRollup
+from utils import report_cache, timewindow
+from utils.rollups import expense_breakdown
+
+GRANULARITIES = ('day', 'week', 'month')
+MAX_RANGE_DAYS = 3 * 366
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def parse_report_window(args, default_days=30):
+    """TimeWindow from ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive); raises ValueError."""
+    if not args.get('from') and not args.get('to'):
+        return timewindow.last_n_days(default_days)
+    try:
+        start = date.fromisoformat(args['from'])
+        last = date.fromisoformat(args.get('to') or str(timewindow.local_today()))
+    except (KeyError, ValueError):
+        raise ValueError('from and to must be dates (YYYY-MM-DD)')
+    if last < start:
+        raise ValueError('to must not be before from')
+    if (last - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'Range is limited to {MAX_RANGE_DAYS} days')
+    return timewindow.between(start, last)
+
+
+def range_report(user_id, window, granularity='day'):
+    """Sales series bucketed by day/week/month plus expense breakdown for a local-day window.
+
+    Reads each day's rollup row once and buckets it in Python, so a year at
+    weekly granularity costs ~365 rows however many sales the shop made.
+    """
+    key = f'range:{window.start_day}:{window.end_day}:{granularity}'
+    cached = report_cache.get(user_id, key, window)
+    if cached is not None:
+        return cached
+
+    rows = DailySalesRollup.query.filter(
+        DailySalesRollup.user_id == user_id,
+        window.day_filter(DailySalesRollup.day),
+        DailySalesRollup.sale_count > 0
+    ).order_by(DailySalesRollup.day).all()
+
+    buckets = {}
+    for r in rows:
+        period = period_start(r.day, granularity)
+        bucket = buckets.setdefault(period, {'date': str(period), 'sales': 0.0, 'profit': 0.0, 'count': 0})
+        bucket['sales'] += float(r.sales_total)
+        bucket['profit'] += float(r.profit_total)
+        bucket['count'] += int(r.sale_count)
+    series = [buckets[p] for p in sorted(buckets)]
+
+    report = {
+        'from': str(window.start_day),
+        'to': str(window.end_day - timedelta(days=1)),
+        'granularity': granularity,
+        'series': series,
+        'totals': {
+            'sales': sum(b['sales'] for b in series),
+            'profit': sum(b['profit'] for b in series),
+            'count': sum(b['count'] for b in series)
+        },
+        'expenses': expense_breakdown(user_id, window)
+    }
+    report_cache.put(user_id, key, window, report)
+    return report
+
+
+# Product performance - answered from product_daily_rollups, never from raw sales
+
+def _product_totals(user_id, window):
+    return db.session.query(
+        ProductDailyRollup.product_id,
+        func.sum(ProductDailyRollup.quantity).label('quantity'),
+        func.sum(ProductDailyRollup.revenue).label('revenue'),
+        func.sum(ProductDailyRollup.profit).label('profit')
+    ).filter(
+        ProductDailyRollup.user_id == user_id,
+        window.day_filter(ProductDailyRollup.day)
+    ).group_by(ProductDailyRollup.product_id)
+
+
+def _ranked(user_id, totals, order_by, limit):
+    ranked = totals.subquery()
+    rows = db.session.query(
+        Product.id, Product.name, Product.stock,
+        ranked.c.quantity, ranked.c.revenue, ranked.c.profit
+    ).join(ranked, ranked.c.product_id == Product.id
+    ).filter(Product.user_id == user_id
+    ).order_by(order_by(ranked)).limit(limit).all()
+    return [{
+        'id': r.id,
+        'name': r.name,
+        'stock': r.stock,
+        'quantity': int(r.quantity or 0),
+        'revenue': float(r.revenue or 0),
+        'profit': float(r.profit or 0),
+        'margin': round(100 * float(r.profit or 0) / float(r.revenue), 1) if r.revenue else 0.0
+    } for r in rows]
+
+
+def top_sellers(user_id, window, limit=10):
+    return _ranked(user_id, _product_totals(user_id, window), lambda t: t.c.quantity.desc(), limit)
+
+
+def margin_ranking(user_id, window, limit=10):
+    totals = _product_totals(user_id, window).having(func.sum(ProductDailyRollup.revenue) > 0)
+    return _ranked(user_id, totals, lambda t: (t.c.profit / t.c.revenue).desc(), limit)
+
+
+def dead_stock(user_id, days=60, limit=50):
+    """Products holding stock that have not sold in the last `days` days."""
+    window = timewindow.last_n_days(days)
+    sold = exists().where(
+        ProductDailyRollup.user_id == user_id,
+        ProductDailyRollup.product_id == Product.id,
+        window.day_filter(ProductDailyRollup.day)
+    )
+    products = Product.query.filter(
+        Product.user_id == user_id,
+        Product.deleted_at.is_(None),
+        Product.stock > 0,
+        ~sold
+    ).order_by((Product.stock * Product.buying_price).desc()).limit(limit).all()
+    return [{
+        'id': p.id,
+        'name': p.name,
+        'stock': p.stock,
+        'stock_value': float((p.stock or 0) * (p.buying_price or 0))
+    } for p in products]
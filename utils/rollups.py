@@ -0,0 +1,142 @@
+from sqlalchemy import func, select, insert, delete, or_, and_
+from models import db, Sale, Expense, DailySalesRollup, DailyExpenseRollup, ProductDailyRollup, ReportCache
+from utils.db import upsert
+from utils.timewindow import local_date, day_bucket
+from utils import report_cache
+
+REBUILD_PAGE_SIZE = 1000  # sales read per query when rebuilding per-product rollups
+
+
+def rollup_day(created_at):
+    return local_date(created_at)
+
+
+def product_lines(user_id, created_at, items, into):
+    """Fold a sale's JSON line items into {(user_id, product_id, day): row} per-product rollup rows."""
+    day = rollup_day(created_at)
+    for line in items or []:
+        try:
+            product_id = int(line['product_id'])
+            quantity = int(line['quantity'])
+            price = float(line.get('selling_price') or 0)
+            cost = float(line.get('buying_price') or 0)
+        except (KeyError, TypeError, ValueError):
+            continue
+        row = into.setdefault((user_id, product_id, day), {'user_id': user_id, 'product_id': product_id,
+                                                           'day': day, 'quantity': 0, 'revenue': 0, 'profit': 0})
+        row['quantity'] += quantity
+        row['revenue'] += price * quantity
+        row['profit'] += (price - cost) * quantity
+    return into
+
+
+def record_sales(sales):
+    """Add sales to their days' rollups, one statement per rollup table. Runs inside the caller's transaction."""
+    days = {}
+    products = {}
+    for sale in sales:
+        product_lines(sale.user_id, sale.created_at, sale.items, products)
+        key = (sale.user_id, rollup_day(sale.created_at))
+        row = days.setdefault(key, {'user_id': key[0], 'day': key[1], 'sales_total': 0, 'cost_total': 0,
+                                    'profit_total': 0, 'sale_count': 0})
+        row['sales_total'] += sale.total_amount
+        row['cost_total'] += sale.total_cost
+        row['profit_total'] += sale.profit
+        row['sale_count'] += 1
+    upsert(DailySalesRollup, list(days.values()), keys=('user_id', 'day'),
+           increment=('sales_total', 'cost_total', 'profit_total', 'sale_count'))
+    upsert(ProductDailyRollup, list(products.values()), keys=('user_id', 'product_id', 'day'),
+           increment=('quantity', 'revenue', 'profit'))
+    for user_id, day in days:
+        report_cache.invalidate(user_id, [day])
+
+
+def record_expense(expense, sign=1):
+    """Add (sign=1) or remove (sign=-1) an expense from its day's category rollup."""
+    upsert(DailyExpenseRollup, [{
+        'user_id': expense.user_id,
+        'day': rollup_day(expense.created_at),
+        'category': expense.category,
+        'amount': sign * expense.amount
+    }], keys=('user_id', 'day', 'category'), increment=('amount',))
+    report_cache.invalidate(expense.user_id, [rollup_day(expense.created_at)])
+
+
+def rebuild_rollups(user_id=None):
+    """Recompute the rollup tables from raw sales and expenses (all users if user_id is None)."""
+    sales_day = day_bucket(Sale.created_at)
+    expense_day = day_bucket(Expense.created_at)
+
+    delete_sales = delete(DailySalesRollup)
+    delete_expenses = delete(DailyExpenseRollup)
+    delete_reports = delete(ReportCache)
+    delete_products = delete(ProductDailyRollup)
+    sales = select(
+        Sale.user_id, sales_day, func.sum(Sale.total_amount), func.sum(Sale.total_cost),
+        func.sum(Sale.profit), func.count(Sale.id)
+    ).group_by(Sale.user_id, sales_day)
+    expenses = select(
+        Expense.user_id, expense_day, Expense.category, func.sum(Expense.amount)
+    ).group_by(Expense.user_id, expense_day, Expense.category)
+
+    if user_id is not None:
+        delete_sales = delete_sales.where(DailySalesRollup.user_id == user_id)
+        delete_expenses = delete_expenses.where(DailyExpenseRollup.user_id == user_id)
+        delete_reports = delete_reports.where(ReportCache.user_id == user_id)
+        delete_products = delete_products.where(ProductDailyRollup.user_id == user_id)
+        sales = sales.where(Sale.user_id == user_id)
+        expenses = expenses.where(Expense.user_id == user_id)
+
+    db.session.execute(delete_sales)
+    db.session.execute(delete_expenses)
+    db.session.execute(delete_reports)
+    db.session.execute(insert(DailySalesRollup).from_select(
+        ['user_id', 'day', 'sales_total', 'cost_total', 'profit_total', 'sale_count'], sales))
+    db.session.execute(insert(DailyExpenseRollup).from_select(
+        ['user_id', 'day', 'category', 'amount'], expenses))
+
+    db.session.execute(delete_products)
+    users = [user_id] if user_id is not None else [u for (u,) in db.session.query(Sale.user_id).distinct()]
+    for uid in users:
+        _rebuild_product_rollups(uid)
+    db.session.commit()
+
+
+def _rebuild_product_rollups(user_id):
+    """Per-product rows from the Sale.items JSON, read in keyset pages of (created_at, id).
+
+    A day is complete once a page ends after it, so its rows are written then:
+    memory holds one page and the days it spans, not the shop's whole history.
+    """
+    products, last = {}, None
+    while True:
+        query = db.session.query(Sale.id, Sale.created_at, Sale.items).filter(Sale.user_id == user_id)
+        if last is not None:
+            query = query.filter(or_(Sale.created_at > last.created_at,
+                                     and_(Sale.created_at == last.created_at, Sale.id > last.id)))
+        page = query.order_by(Sale.created_at, Sale.id).limit(REBUILD_PAGE_SIZE).all()
+        if not page:
+            break
+        for sale in page:
+            product_lines(user_id, sale.created_at, sale.items, products)
+        last = page[-1]
+        current_day = rollup_day(last.created_at)
+        done = [key for key in products if key[2] < current_day]
+        if done:
+            db.session.execute(insert(ProductDailyRollup), [products.pop(key) for key in done])
+    if products:
+        db.session.execute(insert(ProductDailyRollup), list(products.values()))
+
+
+# Readers - take a utils.timewindow.TimeWindow; cost depends on the number of days, not sales
+
+def expense_breakdown(user_id, window):
+    rows = db.session.query(
+        DailyExpenseRollup.category,
+        func.sum(DailyExpenseRollup.amount).label('amount')
+    ).filter(
+        DailyExpenseRollup.user_id == user_id,
+        window.day_filter(DailyExpenseRollup.day)
+    ).group_by(DailyExpenseRollup.category).all()
+    return [{'category': e.category.title() if e.category else 'Other', 'amount': float(e.amount or 0)}
+            for e in rows if round(e.amount or 0, 2)]
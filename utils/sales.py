@@ -0,0 +1,266 @@
+from datetime import datetime, timezone
+from sqlalchemy import update, insert
+from models import db, Product, Sale, SaleItem, IdempotencyKey
+from utils.rollups import record_sales
+from utils.catalog import mark_changed
+from utils.inventory import record_sale_movements
+from utils.low_stock import refresh_low_stock
+
+
+class SaleError(Exception):
+    status_code = 400
+
+    def __init__(self, message, product_id=None):
+        super().__init__(message)
+        self.message = message
+        self.product_id = product_id
+
+
+class InsufficientStock(SaleError):
+    status_code = 409
+
+
+def cart_quantities(items):
+    """Collapse cart lines into {product_id: quantity}, rejecting malformed lines."""
+    quantities = {}
+    for item in items:
+        try:
+            product_id = int(item['product_id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise SaleError('Each item needs a product_id and quantity')
+        if quantity <= 0:
+            raise SaleError('Quantity must be positive', product_id)
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def cart_prices(items):
+    """{product_id: unit_price} for lines that carry the price the customer was charged.
+
+    Queued (offline) sales send it so a price change made before the upload
+    does not alter the revenue recorded for a sale that already happened.
+    """
+    prices = {}
+    for item in items:
+        if item.get('unit_price') is None:
+            continue
+        product_id = int(item['product_id'])
+        try:
+            price = float(item['unit_price'])
+        except (TypeError, ValueError):
+            raise SaleError('unit_price must be a number', product_id)
+        if price < 0:
+            raise SaleError('unit_price cannot be negative', product_id)
+        if prices.setdefault(product_id, price) != price:
+            raise SaleError('Conflicting unit_price for the same product', product_id)
+    return prices
+
+
+def load_products(user_id, product_ids, lock=False):
+    """Fetch every product in the cart with one query."""
+    query = Product.query.filter(
+        Product.user_id == user_id,
+        Product.id.in_(product_ids),
+        Product.deleted_at.is_(None)
+    )
+    if lock:
+        query = query.with_for_update()
+    return {p.id: p for p in query.all()}
+
+
+def check_products(quantities, products):
+    for product_id in quantities:
+        if product_id not in products:
+            raise SaleError('Product not found', product_id)
+
+
+def decrement_stock(user_id, quantities, products):
+    """Take stock with conditional UPDATEs so two tills can never oversell the same item.
+
+    Rows are touched in id order to keep lock acquisition consistent between
+    concurrent sales. Raises InsufficientStock; the caller must roll back.
+    """
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == product_id,
+                   Product.user_id == user_id,
+                   Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            name = products[product_id].name
+            raise InsufficientStock(f'Not enough stock for {name}', product_id)
+
+
+def build_sale(user_id, quantities, products, payment_method='cash', created_at=None, prices=None):
+    """Sale priced from the current catalog, or from `prices` where the client sent the charged price."""
+    prices = prices or {}
+    lines = [{
+        'product_id': product_id,
+        'name': products[product_id].name,
+        'quantity': quantity,
+        'selling_price': prices.get(product_id, products[product_id].selling_price),
+        'buying_price': products[product_id].buying_price
+    } for product_id, quantity in quantities.items()]
+
+    total_amount = sum(line['selling_price'] * line['quantity'] for line in lines)
+    total_cost = sum(line['buying_price'] * line['quantity'] for line in lines)
+
+    return Sale(
+        user_id=user_id,
+        total_amount=total_amount,
+        total_cost=total_cost,
+        profit=total_amount - total_cost,
+        payment_method=payment_method,
+        items=lines,
+        created_at=created_at or datetime.utcnow()
+    )
+
+
+def persist_sales(sales):
+    """Insert sales, their SaleItem rows and rollup deltas with a fixed number of statements."""
+    db.session.add_all(sales)
+    db.session.flush()
+
+    db.session.execute(insert(SaleItem), [{
+        'sale_id': sale.id,
+        'product_id': line['product_id'],
+        'quantity': line['quantity'],
+        'unit_price': line['selling_price'],
+        'total_price': line['selling_price'] * line['quantity']
+    } for sale in sales for line in sale.items])
+    record_sales(sales)
+    record_sale_movements(sales)
+
+
+def process_sale(user_id, items, payment_method='cash', created_at=None):
+    """Record a sale, its SaleItem rows, stock and rollups in the current transaction."""
+    quantities = cart_quantities(items)
+    if not quantities:
+        raise SaleError('Cart is empty')
+
+    products = load_products(user_id, list(quantities))
+    check_products(quantities, products)
+    decrement_stock(user_id, quantities, products)
+    mark_changed(user_id, quantities)
+    refresh_low_stock(user_id, quantities)
+
+    sale = build_sale(user_id, quantities, products, payment_method, created_at)
+    persist_sales([sale])
+    return sale
+
+
+def parse_sold_at(value):
+    """Client-side sale time for queued sales, as naive UTC. Falls back to now if missing or in the future."""
+    now = datetime.utcnow()
+    if not value:
+        return now
+    try:
+        sold_at = datetime.fromisoformat(str(value))
+    except ValueError:
+        return now
+    if sold_at.tzinfo is not None:
+        sold_at = sold_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(sold_at, now)
+
+
+def sale_result(sale):
+    return {'id': sale.id, 'total': sale.total_amount, 'profit': sale.profit}
+
+
+def process_sale_batch(user_id, entries):
+    """Ingest queued sales in one transaction.
+
+    Each entry carries a client-generated idempotency_key. Keys already stored
+    replay their original result, new sales are checked in order against the
+    locked stock levels and applied with one stock update per product. Sales
+    that do not fit are reported as rejected and are not stored, so the client
+    may retry them after restocking. Lines may carry the unit_price charged at
+    the till, which is recorded instead of the current catalog price.
+    """
+    results = [None] * len(entries)
+    pending = {}
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results[index] = {'status': 'rejected', 'error': 'Each sale must be an object'}
+            continue
+        key = str(entry.get('idempotency_key') or '').strip()
+        if not key or len(key) > 64:
+            results[index] = {'status': 'rejected', 'error': 'Missing or invalid idempotency_key'}
+            continue
+        pending.setdefault(key, []).append(index)
+
+    stored = IdempotencyKey.query.filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key.in_(list(pending))
+    ).all() if pending else []
+    for record in stored:
+        for index in pending.pop(record.key, []):
+            results[index] = dict(record.response, status='duplicate')
+
+    carts, prices = {}, {}
+    for key, indexes in pending.items():
+        try:
+            items = entries[indexes[0]].get('items') or []
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                raise SaleError('Each item needs a product_id and quantity')
+            carts[key] = cart_quantities(items)
+            if not carts[key]:
+                raise SaleError('Cart is empty')
+            prices[key] = cart_prices(items)
+        except SaleError as e:
+            carts.pop(key, None)
+            results[indexes[0]] = {'status': 'rejected', 'error': e.message, 'product_id': e.product_id}
+
+    product_ids = {product_id for quantities in carts.values() for product_id in quantities}
+    products = load_products(user_id, list(product_ids), lock=True) if product_ids else {}
+    available = {product_id: product.stock or 0 for product_id, product in products.items()}
+
+    accepted = []
+    totals = {}
+    for key, quantities in carts.items():
+        index = pending[key][0]
+        try:
+            check_products(quantities, products)
+            for product_id, quantity in quantities.items():
+                if available[product_id] < quantity:
+                    raise InsufficientStock(f'Not enough stock for {products[product_id].name}', product_id)
+        except SaleError as e:
+            results[index] = {'status': 'rejected', 'error': e.message, 'product_id': e.product_id}
+            continue
+        for product_id, quantity in quantities.items():
+            available[product_id] -= quantity
+            totals[product_id] = totals.get(product_id, 0) + quantity
+        entry = entries[index]
+        sale = build_sale(user_id, quantities, products, entry.get('payment_method', 'cash'),
+                          parse_sold_at(entry.get('created_at')), prices[key])
+        accepted.append((key, sale))
+
+    if accepted:
+        decrement_stock(user_id, totals, products)
+        mark_changed(user_id, totals)
+        refresh_low_stock(user_id, totals)
+        persist_sales([sale for _, sale in accepted])
+        db.session.execute(insert(IdempotencyKey), [{
+            'user_id': user_id,
+            'key': key,
+            'sale_id': sale.id,
+            'response': sale_result(sale),
+            'created_at': datetime.utcnow()
+        } for key, sale in accepted])
+
+    for key, sale in accepted:
+        results[pending[key][0]] = dict(sale_result(sale), status='created')
+    # Repeats of a key inside the same batch replay the first occurrence
+    for key, indexes in pending.items():
+        for index in indexes[1:]:
+            first = results[indexes[0]]
+            results[index] = dict(first, status='duplicate') if first['status'] == 'created' else dict(first)
+
+    for entry, result in zip(entries, results):
+        result['idempotency_key'] = entry.get('idempotency_key') if isinstance(entry, dict) else None
+    return results
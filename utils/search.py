@@ -0,0 +1,68 @@
+import re
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.mysql import match
+from models import db, Product
+from utils.pagination import encode_cursor, decode_cursor
+
+MAX_LIMIT = 100
+MAX_TOKENS = 5
+# InnoDB's default innodb_ft_min_token_size; shorter words are never in the FULLTEXT index
+FULLTEXT_MIN_TOKEN = 3
+
+
+def tokenize(q):
+    return re.findall(r'\w+', (q or '').lower())[:MAX_TOKENS]
+
+
+def _token_prefix(column, token):
+    """`token` starts the value or any word in it."""
+    return or_(column.startswith(token, autoescape=True), column.contains(' ' + token, autoescape=True))
+
+
+def _token_filter(tokens):
+    """Every token must prefix-match a word in name, model number or category.
+
+    On MySQL the tokens go to the FULLTEXT index; elsewhere (SQLite in
+    development) they become LIKE patterns inside the user's rows.
+    """
+    columns = (Product.name, Product.model_number, Product.category)
+    long_tokens = [t for t in tokens if len(t) >= FULLTEXT_MIN_TOKEN]
+    clauses = []
+    if long_tokens and db.engine.dialect.name == 'mysql':
+        against = ' '.join(f'+{t}*' for t in long_tokens)
+        clauses.append(match(*columns, against=against).in_boolean_mode())
+        tokens = [t for t in tokens if t not in long_tokens]
+    for token in tokens:
+        clauses.append(or_(*(_token_prefix(column, token) for column in columns)))
+    return and_(*clauses)
+
+
+def search_products(user_id, q, limit=50, cursor=None):
+    """One page of the user's products matching `q`, ordered by name; returns (products, next_cursor)."""
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    query = Product.query.filter(Product.user_id == user_id, Product.deleted_at.is_(None))
+
+    tokens = tokenize(q)
+    if len(tokens) == 1 and len(tokens[0]) < FULLTEXT_MIN_TOKEN:
+        # Too short for FULLTEXT: plain name / model prefix, served by the (user_id, name|model_number) indexes
+        token = tokens[0]
+        query = query.filter(or_(Product.name.startswith(token, autoescape=True),
+                                 Product.model_number.startswith(token, autoescape=True)))
+    elif tokens:
+        query = query.filter(_token_filter(tokens))
+
+    if cursor:
+        name, last_id = decode_cursor(cursor)
+        query = query.filter(or_(Product.name > name, and_(Product.name == name, Product.id > last_id)))
+
+    products = query.order_by(Product.name, Product.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor([products[-1].name, products[-1].id])
+    return products, next_cursor
+
+
+def products_by_barcode(user_id, barcode, limit=20):
+    """Exact barcode match within one shop (ix_products_user_barcode)."""
+    return Product.query.filter_by(user_id=user_id, barcode=barcode, deleted_at=None).order_by(Product.id).limit(limit).all()
@@ -1,40 +1,168 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import groupby
 import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import insert, select, update, literal
+from config import Config
+from models import db, User, SmsMessage
 
-# Africa's Talking or similar SMS API
-SMS_API_KEY = None  # Set in config
-SMS_SENDER_ID = "TAKWIMU"
+# Outbound SMS go through the sms_outbox table: requests only queue rows
+# (committed with the rest of their transaction) and `flask send-sms` sends
+# them in multi-recipient batches, retrying failures with backoff.
 
+_session = None
 
-def send_sms(phone, message):
-    """Send SMS notification to user's phone"""
-    if not SMS_API_KEY:
-        print(f"[SMS Mock] To: {phone}, Message: {message}")
-        return True
 
-    # Using Africa's Talking API (popular in Tanzania)
-    try:
-        response = requests.post(
-            'https://api.africastalking.com/version1/messaging',
-            headers={
-                'apiKey': SMS_API_KEY,
-                'Content-Type': 'application/x-www-form-urlencoded'
-            },
-            data={
-                'username': 'sandbox',  # Change for production
-                'to': phone,
-                'message': message,
-                'from': SMS_SENDER_ID
-            }
-        )
-        return response.status_code == 201
-    except Exception as e:
-        print(f"SMS Error: {e}")
-        return False
+def _gateway():
+    """Pooled keep-alive session to the SMS gateway."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.mount('https://', HTTPAdapter(pool_maxsize=4))
+        _session.mount('http://', HTTPAdapter(pool_maxsize=4))
+    return _session
+
+
+def normalize_phone(phone):
+    """E.164 form the gateway reports back, e.g. 0712 345 678 -> +255712345678."""
+    phone = ''.join(ch for ch in phone if ch.isdigit() or ch == '+')
+    if phone.startswith('0') and len(phone) == 10:
+        return '+255' + phone[1:]
+    if phone.startswith('255'):
+        return '+' + phone
+    return phone
+
+
+def format_message(subject, content):
+    return f"TAKWIMU+: {subject}\n{content[:100]}"
+
+
+def queue_sms(phone, message, user_id=None):
+    """Queue one SMS in the current transaction; it is sent once the caller commits."""
+    db.session.add(SmsMessage(user_id=user_id, phone=phone, message=message[:480]))
 
 
 def notify_user_sms(user, subject, content):
-    """Send notification SMS to user"""
+    """Queue a notification SMS to the user's phone"""
     if user.phone:
-        message = f"TAKWIMU+: {subject}\n{content[:100]}"
-        return send_sms(user.phone, message)
-    return False
\ No newline at end of file
+        queue_sms(user.phone, format_message(subject, content), user.id)
+        return True
+    return False
+
+
+def queue_sms_to_all_users(subject, content):
+    """Queue the same SMS for every user with a phone, in one INSERT ... SELECT."""
+    message = format_message(subject, content)
+    now = datetime.utcnow()
+    users = select(User.id, User.phone, literal(message), literal('queued'), literal(0), literal(now), literal(now)) \
+        .where(User.phone.isnot(None), User.phone != '')
+    result = db.session.execute(insert(SmsMessage).from_select(
+        ['user_id', 'phone', 'message', 'status', 'attempts', 'next_attempt_at', 'created_at'], users))
+    return result.rowcount
+
+
+Claimed = namedtuple('Claimed', ['id', 'phone', 'message', 'attempts'])
+
+
+def claim_batch(limit):
+    """Lease up to `limit` due messages to this worker; returns Claimed tuples.
+
+    Claimed rows move to "sending" with next_attempt_at pushed out by the
+    lease, so a worker that dies mid-send leaves them to be retried.
+    SKIP LOCKED lets several workers claim side by side on MySQL 8. Plain
+    tuples are returned so nothing is reloaded after the commit.
+    """
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        select(SmsMessage.id, SmsMessage.phone, SmsMessage.message, SmsMessage.attempts).where(
+            SmsMessage.status.in_(('queued', 'sending')),
+            SmsMessage.next_attempt_at <= now
+        ).order_by(SmsMessage.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+    ).all()
+    if rows:
+        db.session.execute(
+            update(SmsMessage)
+            .where(SmsMessage.id.in_([r.id for r in rows]))
+            .values(status='sending',
+                    attempts=SmsMessage.attempts + 1,
+                    next_attempt_at=now + timedelta(seconds=Config.SMS_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return [Claimed(r.id, r.phone, r.message, r.attempts + 1) for r in rows]
+
+
+def _retry_or_fail(row, error):
+    """Update values for a failed send of a Claimed row."""
+    values = {'id': row.id, 'last_error': str(error)[:255]}
+    if row.attempts >= Config.SMS_MAX_ATTEMPTS:
+        values.update(status='failed', next_attempt_at=datetime.utcnow())
+    else:
+        # 1, 2, 4, 8... minutes
+        values.update(status='queued',
+                      next_attempt_at=datetime.utcnow() + timedelta(minutes=2 ** (row.attempts - 1)))
+    return values
+
+
+def send_batch(phones, message):
+    """POST one message to many recipients; returns {phone: (ok, message_id, cost, error)}."""
+    if not Config.SMS_API_KEY:
+        print(f"[SMS Mock] To: {', '.join(phones)}, Message: {message}")
+        return {phone: (True, None, None, None) for phone in phones}
+
+    response = _gateway().post(
+        Config.SMS_API_URL,
+        headers={'apiKey': Config.SMS_API_KEY, 'Accept': 'application/json'},
+        data={
+            'username': Config.SMS_USERNAME,
+            'to': ','.join(phones),
+            'message': message,
+            'from': Config.SMS_SENDER_ID
+        },
+        timeout=Config.SMS_TIMEOUT
+    )
+    response.raise_for_status()
+    recipients = response.json().get('SMSMessageData', {}).get('Recipients', [])
+    results = {}
+    for r in recipients:
+        # Africa's Talking: 100 Processed, 101 Sent, 102 Queued; anything else is a failure
+        ok = r.get('statusCode') in (100, 101, 102)
+        results[r.get('number')] = (ok, r.get('messageId'), r.get('cost'), None if ok else r.get('status'))
+    return results
+
+
+def dispatch_pending(limit=500):
+    """Send one round of due messages, grouped into multi-recipient requests. Returns (sent, failed)."""
+    rows = claim_batch(limit)
+    sent = failed = 0
+    by_message = sorted(rows, key=lambda r: r.message)
+    for message, group in groupby(by_message, key=lambda r: r.message):
+        group = list(group)
+        for start in range(0, len(group), Config.SMS_BATCH_SIZE):
+            chunk = group[start:start + Config.SMS_BATCH_SIZE]
+            try:
+                results = send_batch(sorted({normalize_phone(r.phone) for r in chunk}), message)
+            except (requests.RequestException, ValueError) as e:
+                results = {}
+                error = e
+            else:
+                error = 'No status from gateway'
+            now = datetime.utcnow()
+            sent_rows, failed_rows = [], []
+            for row in chunk:
+                ok, message_id, cost, row_error = results.get(normalize_phone(row.phone), (False, None, None, error))
+                if ok:
+                    sent_rows.append({'id': row.id, 'status': 'sent', 'sent_at': now,
+                                      'provider_message_id': message_id, 'cost': cost, 'last_error': None})
+                else:
+                    failed_rows.append(_retry_or_fail(row, row_error))
+            # One executemany per outcome instead of an UPDATE per row
+            if sent_rows:
+                db.session.execute(update(SmsMessage), sent_rows)
+            if failed_rows:
+                db.session.execute(update(SmsMessage), failed_rows)
+            db.session.commit()
+            sent += len(sent_rows)
+            failed += len(failed_rows)
+    return sent, failed
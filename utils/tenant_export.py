@@ -0,0 +1,130 @@
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, func
+from config import Config
+from models import db, Sale, Expense, Product
+from utils import timewindow
+from utils.csv_export import stream_rows, csv_chunks
+from utils.jobs import job
+
+# A shop's own data for its accountant: one entity per export, rows streamed
+# from the database in yield_per batches and written as CSV or NDJSON.
+
+FORMATS = {'csv': ('text/csv', 'csv'), 'ndjson': ('application/x-ndjson', 'ndjson')}
+
+
+def _local(ts):
+    return timewindow.to_local(ts).strftime('%Y-%m-%d %H:%M:%S') if ts else None
+
+
+def _sales(user_id, window):
+    """One row per sale line, flattened out of Sale.items."""
+    query = select(Sale.id, Sale.created_at, Sale.payment_method, Sale.items).where(
+        Sale.user_id == user_id).order_by(Sale.created_at, Sale.id)
+    if window:
+        query = query.where(window.filter(Sale.created_at))
+    for sale in stream_rows(query):
+        for line in sale.items or []:
+            quantity = line.get('quantity', 0)
+            selling, buying = line.get('selling_price', 0), line.get('buying_price', 0)
+            yield (sale.id, _local(sale.created_at), sale.payment_method, line.get('product_id'), line.get('name'),
+                   quantity, selling, buying, selling * quantity, (selling - buying) * quantity)
+
+
+def _expenses(user_id, window):
+    query = select(Expense.id, Expense.created_at, Expense.category, Expense.description, Expense.amount).where(
+        Expense.user_id == user_id).order_by(Expense.created_at, Expense.id)
+    if window:
+        query = query.where(window.filter(Expense.created_at))
+    for e in stream_rows(query):
+        yield (e.id, _local(e.created_at), e.category, e.description, e.amount)
+
+
+def _products(user_id, window):
+    # Products are a current list, not history, so the date range does not apply
+    query = select(Product.id, Product.name, Product.model_number, Product.barcode, Product.category,
+                   Product.buying_price, Product.selling_price, Product.stock).where(
+        Product.user_id == user_id, Product.deleted_at.is_(None)).order_by(Product.id)
+    for p in stream_rows(query):
+        yield tuple(p)
+
+
+ENTITIES = {
+    'sales': (['sale_id', 'date', 'payment_method', 'product_id', 'product', 'quantity',
+               'selling_price', 'buying_price', 'line_total', 'line_profit'], _sales),
+    'expenses': (['expense_id', 'date', 'category', 'description', 'amount'], _expenses),
+    'products': (['product_id', 'name', 'model_number', 'barcode', 'category',
+                  'buying_price', 'selling_price', 'stock'], _products),
+}
+
+
+def estimate_rows(user_id, entity, window):
+    """Rough size used to decide between streaming now and a background job (sales count sales, not lines)."""
+    model = {'sales': Sale, 'expenses': Expense, 'products': Product}[entity]
+    query = db.session.query(func.count(model.id)).filter(model.user_id == user_id)
+    if window and entity != 'products':
+        query = query.filter(window.filter(model.created_at))
+    return query.scalar()
+
+
+def export_chunks(user_id, entity, fmt, window):
+    """Generate the export as text chunks in the requested format."""
+    header, rows = ENTITIES[entity]
+    rows = rows(user_id, window)
+    if fmt == 'csv':
+        yield from csv_chunks(header, rows)
+        return
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, row))))
+        if len(lines) == 500:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_filename(entity, fmt, window):
+    span = f'_{window.start_day}_{window.end_day - timedelta(days=1)}' if window else ''
+    return f'{entity}{span}.{FORMATS[fmt][1]}'
+
+
+def export_path(user_id, token):
+    return os.path.join(Config.EXPORT_DIR, str(user_id), f'{token}.gz')
+
+
+@job(name='tenant_export.write_export', max_attempts=2)
+def write_export(user_id, entity, fmt, start_day=None, end_day=None, token=None):
+    """Background export: stream the same chunks into a gzip file for later download."""
+    window = timewindow.TimeWindow(date.fromisoformat(start_day), date.fromisoformat(end_day)) if start_day else None
+    path = export_path(user_id, token)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path + '.part', 'wt', encoding='utf-8', newline='') as out:
+        for chunk in export_chunks(user_id, entity, fmt, window):
+            out.write(chunk)
+    os.replace(path + '.part', path)
+    return {'filename': export_filename(entity, fmt, window) + '.gz', 'bytes': os.path.getsize(path)}
+
+
+def export_expired(finished_at):
+    return finished_at is None or finished_at < datetime.utcnow() - timedelta(seconds=Config.EXPORT_TTL)
+
+
+@job(name='tenant_export.sweep_exports', max_attempts=1, every=3600)
+def sweep_exports():
+    """Delete export files (and abandoned .part files) untouched for longer than EXPORT_TTL."""
+    cutoff = time.time() - Config.EXPORT_TTL
+    removed = 0
+    for folder, _, files in os.walk(Config.EXPORT_DIR):
+        for name in files:
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return {'removed': removed}
@@ -0,0 +1,132 @@
+from collections import namedtuple
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import and_, Date, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from config import Config
+
+# Timestamps are stored as naive UTC (datetime.utcnow) while shops think in
+# local business days. Everything here converts a local calendar period into a
+# half-open [start, end) range of naive UTC datetimes so filters stay sargable:
+#     created_at >= start AND created_at < end
+
+
+def business_tz():
+    return ZoneInfo(Config.BUSINESS_TIMEZONE)
+
+
+def local_now():
+    return datetime.now(business_tz())
+
+
+def local_today():
+    return local_now().date()
+
+
+def to_utc(day):
+    """Naive UTC datetime of local midnight at the start of `day`."""
+    local_midnight = datetime.combine(day, time.min, tzinfo=business_tz())
+    return local_midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_local(utc_dt):
+    """Aware local datetime for a stored (naive UTC) timestamp."""
+    return utc_dt.replace(tzinfo=timezone.utc).astimezone(business_tz())
+
+
+def local_date(utc_dt):
+    """Local business day a stored (naive UTC) timestamp falls on."""
+    return to_local(utc_dt).date()
+
+
+class TimeWindow(namedtuple('TimeWindow', ['start_day', 'end_day'])):
+    """Local days [start_day, end_day) - end_day is exclusive."""
+
+    @property
+    def start(self):
+        return to_utc(self.start_day)
+
+    @property
+    def end(self):
+        return to_utc(self.end_day)
+
+    @property
+    def days(self):
+        return (self.end_day - self.start_day).days
+
+    def filter(self, column):
+        return and_(column >= self.start, column < self.end)
+
+    def day_filter(self, column):
+        """Same window against a local-date column such as the rollup tables' `day`."""
+        return and_(column >= self.start_day, column < self.end_day)
+
+    def contains(self, day):
+        return self.start_day <= day < self.end_day
+
+
+def between(start_day, last_day):
+    """Window covering local days start_day..last_day inclusive."""
+    return TimeWindow(start_day, last_day + timedelta(days=1))
+
+
+def today():
+    day = local_today()
+    return TimeWindow(day, day + timedelta(days=1))
+
+
+def last_n_days(n):
+    """The last n local days, today included."""
+    day = local_today()
+    return TimeWindow(day - timedelta(days=n - 1), day + timedelta(days=1))
+
+
+def this_month():
+    day = local_today()
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return TimeWindow(start, end)
+
+
+def this_quarter():
+    day = local_today()
+    start = date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    end = date(start.year + 1, 1, 1) if start.month == 10 else date(start.year, start.month + 3, 1)
+    return TimeWindow(start, end)
+
+
+def utc_offset_minutes():
+    return int(local_now().utcoffset().total_seconds() // 60)
+
+
+class local_day(FunctionElement):
+    """Local business date of a UTC timestamp column, for GROUP BY after a range filter.
+
+    Uses the zone's current UTC offset, which is exact for East Africa Time
+    (no daylight saving).
+    """
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(local_day)
+def _local_day_default(element, compiler, **kw):
+    column, minutes = list(element.clauses)
+    return "DATE(%s + INTERVAL '%s minutes')" % (compiler.process(column, **kw), minutes.name)
+
+
+@compiles(local_day, 'mysql')
+def _local_day_mysql(element, compiler, **kw):
+    column, minutes = list(element.clauses)
+    return 'DATE(DATE_ADD(%s, INTERVAL %s MINUTE))' % (compiler.process(column, **kw), minutes.name)
+
+
+@compiles(local_day, 'sqlite')
+def _local_day_sqlite(element, compiler, **kw):
+    column, minutes = list(element.clauses)
+    return "date(%s, '%+d minutes')" % (compiler.process(column, **kw), int(minutes.name))
+
+
+def day_bucket(column):
+    return local_day(column, literal_column(str(utc_offset_minutes())))
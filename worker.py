@@ -0,0 +1,103 @@
+"""Background worker: runs queued jobs and drains the SMS outbox.
+
+    python worker.py                  # uses JOB_WORKER_POOL / JOB_WORKER_CONCURRENCY
+    python worker.py --pool process --concurrency 8
+
+Run as many of these as needed next to the web workers; jobs and SMS are
+leased with SKIP LOCKED, so workers never pick up the same row. Leases of
+jobs still running are renewed every JOB_HEARTBEAT_INTERVAL seconds, so a
+long export is not handed to a second worker while the first is busy.
+Periodic jobs (e.g. sweeping expired exports) are queued from here too, so
+at least one worker must be running. Exports are written to EXPORT_DIR and
+served by the web process, so both must see the same directory.
+"""
+import argparse
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from app import create_app
+from config import Config
+
+_app = None
+
+
+def _init_process():
+    # Each pool process gets its own app and connection pool; nothing is shared across fork
+    global _app
+    _app = create_app()
+
+
+def _run(job_id):
+    from utils.jobs import run_job
+    with _app.app_context():
+        return run_job(job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pool', choices=('thread', 'process'), default=Config.JOB_WORKER_POOL)
+    parser.add_argument('--concurrency', type=int, default=Config.JOB_WORKER_CONCURRENCY)
+    parser.add_argument('--no-sms', action='store_true', help='Leave the SMS outbox to `flask send-sms`')
+    options = parser.parse_args()
+
+    global _app
+    _app = create_app()
+    from utils.jobs import claim, extend_leases, schedule_periodic
+    from utils.sms import dispatch_pending
+
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    if options.pool == 'process':
+        pool = ProcessPoolExecutor(max_workers=options.concurrency, initializer=_init_process)
+    else:
+        pool = ThreadPoolExecutor(max_workers=options.concurrency, thread_name_prefix='job')
+    print(f'Worker {worker_id}: {options.concurrency} {options.pool} workers')
+
+    running = {}  # future -> job id
+    last_beat = time.monotonic()
+    last_schedule = None
+
+    def heartbeat(force=False):
+        # Keep the leases of jobs still running here from expiring, however long they take
+        nonlocal last_beat
+        if running and (force or time.monotonic() - last_beat >= Config.JOB_HEARTBEAT_INTERVAL):
+            with _app.app_context():
+                extend_leases(list(running.values()), worker_id)
+            last_beat = time.monotonic()
+
+    def reap(timeout):
+        done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            running.pop(future)
+
+    try:
+        while True:
+            busy = False
+            with _app.app_context():
+                if last_schedule is None or time.monotonic() - last_schedule >= Config.JOB_SCHEDULE_INTERVAL:
+                    schedule_periodic()
+                    last_schedule = time.monotonic()
+                free = options.concurrency - len(running)
+                if free > 0:
+                    for job_id in claim(free, worker_id):
+                        running[pool.submit(_run, job_id)] = job_id
+                        busy = True
+                if not options.no_sms:
+                    sent, failed = dispatch_pending()
+                    busy = busy or bool(sent or failed)
+            heartbeat()
+            if running:
+                reap(0 if busy else Config.JOB_POLL_INTERVAL)
+            elif not busy:
+                time.sleep(Config.JOB_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print('Stopping: waiting for running jobs to finish')
+        while running:
+            heartbeat(force=True)
+            reap(Config.JOB_HEARTBEAT_INTERVAL)
+    finally:
+        pool.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    main()